@@ -1,16 +1,35 @@
-from ultralytics import YOLO
 import cv2
 import time
-from collections import deque
 from datetime import datetime
 import os
-from flask import Flask, jsonify, send_from_directory, request
+from flask import Flask, jsonify, send_from_directory, request, Response
 from flask_cors import CORS
 import threading
 import sqlite3
-import requests
+import socket
+import csv
+import io
 import cloudinary
 import cloudinary.uploader
+import scan_channel
+import clip_writer
+import events_db
+import clip_storage
+import metrics
+import clip_uploader
+import edge_sync
+import event_archive
+import response_cache
+import event_json
+import motion_tracker
+import vision_workers
+import camera_capture
+import load_control
+import profiler
+import flight_recorder
+import camera_status
+import event_wire
+import hmac
 
 # -------------------------------
 # FLASK SERVER
@@ -34,31 +53,56 @@ cloudinary.config(
 # DATABASE SETUP
 # -------------------------------
 
-conn = sqlite3.connect("events.db", check_same_thread=False)
+DB_PATH = os.environ.get("EVENTS_DB", "events.db")
+
+conn = sqlite3.connect(DB_PATH, check_same_thread=False)
 cursor = conn.cursor()
 
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS events (
- id INTEGER PRIMARY KEY AUTOINCREMENT,
- timestamp TEXT,
- status TEXT,
- clip_path TEXT,
- camera_id TEXT
-)
-""")
-conn.commit()
+events_db.init(conn)
+event_archive.init(conn)
+camera_status.init(conn)
+
+scan_channel.init(conn)
+
+# Read endpoints are cached until the events table version changes
+events_cache = response_cache.ResponseCache(lambda: events_db.table_version(conn))
+
+# Events older than ARCHIVE_HOT_DAYS move to monthly archive tables; one
+# worker at a time does the moving. 0 disables archiving
+ARCHIVE_HOT_DAYS = int(os.environ.get("ARCHIVE_HOT_DAYS", event_archive.HOT_DAYS))
+if ARCHIVE_HOT_DAYS > 0:
+ archiver = event_archive.Archiver(DB_PATH, hot_days=ARCHIVE_HOT_DAYS)
+ archiver.start()
 
 # -------------------------------
 # AI MODEL + CAMERA (LOCAL ONLY)
 # -------------------------------
 
-if os.environ.get("RENDER") != "true":
- model = YOLO("yolov8n.pt")
- cap = cv2.VideoCapture(0)
+# "process" runs the model in a worker process fed through shared memory,
+# "inline" runs it in this process
+INFERENCE_MODE = os.environ.get("INFERENCE_MODE", "process")
+MODEL_WEIGHTS = os.environ.get("MODEL_WEIGHTS", "yolov8n.pt")
+
+# Identical frames for this long count as a dead camera
+CAMERA_FREEZE_SECONDS = float(os.environ.get("CAMERA_FREEZE_SECONDS", 5))
 
- FPS = int(cap.get(cv2.CAP_PROP_FPS) or 30)
+if os.environ.get("RENDER") != "true":
+ if INFERENCE_MODE == "inline":
+  detector = vision_workers.LocalDetector(MODEL_WEIGHTS)
+ else:
+  detector = vision_workers.InferenceWorker(MODEL_WEIGHTS)
+ # Capture settings come from CAMERA_* (mode, size, fourcc, fps, buffer);
+ # the supervisor reopens the camera when reads fail or the picture freezes
+ camera = camera_capture.CaptureSupervisor(
+  camera_capture.settings_from_env(),
+  freeze_seconds=CAMERA_FREEZE_SECONDS
+ )
+
+ FPS = int(camera.info["fps"] or camera.info["measured_fps"] or 30)
  BUFFER_SECONDS = 10
- buffer = deque(maxlen=FPS * BUFFER_SECONDS)
+ # Retained by capture time; the frame cap (4x the reported rate) only
+ # bounds memory if timestamps misbehave
+ buffer = clip_writer.FrameBuffer(BUFFER_SECONDS, max_frames=FPS * BUFFER_SECONDS * 4)
 else:
  FPS = 30
  BUFFER_SECONDS = 10
@@ -73,13 +117,59 @@ scan_start = None
 flagged = False
 primary_id = None
 secondary_detect_time = None
-scan_triggered = False
 TOLERANCE_SECONDS = 1.0
+secondary_seen_ids = set()
+CAMERA_ID = os.environ.get("CAMERA_ID", "CAM_01")
 
 last_status = None
 status_color = (0, 255, 0)
 status_display_until = 0
 
+# Clip trimming around the first secondary detection; the post-roll is
+# recorded live after the verdict
+CLIP_PRE_ROLL_SECONDS = 2.0
+CLIP_POST_ROLL_SECONDS = 3.0
+UPLOAD_FPS = None
+UPLOAD_SCALE = 1.0
+CLIP_ENCODER = os.environ.get("CLIP_ENCODER", "auto")  # auto | ffmpeg | opencv
+
+# Run the detector at most every N frames (1 = every frame); boxes are
+# predicted in between
+DETECT_MAX_INTERVAL = int(os.environ.get("DETECT_MAX_INTERVAL", 1))
+
+# Per-frame latency target; above it the loop sheds load (preview refresh,
+# inference imgsz, detection rate). 0 disables shedding
+FRAME_LATENCY_TARGET_MS = float(os.environ.get("FRAME_LATENCY_TARGET_MS", 100))
+
+# Local clip storage limits (clips/ on the edge box)
+CLIP_QUOTA_BYTES = int(os.environ.get("CLIP_QUOTA_BYTES", 2 * 1024 ** 3))
+CLIP_MAX_AGE_DAYS = float(os.environ.get("CLIP_MAX_AGE_DAYS", 14))
+
+# Clip upload: "cloudinary" or "local" (a directory standing in for a bucket)
+UPLOAD_BACKEND = os.environ.get("UPLOAD_BACKEND", "cloudinary")
+UPLOAD_LOCAL_DIR = os.environ.get("UPLOAD_LOCAL_DIR", "uploads")
+UPLOAD_CHUNK_BYTES = int(os.environ.get("UPLOAD_CHUNK_BYTES", 5 * 1024 * 1024))
+UPLOAD_MAX_BPS = int(os.environ.get("UPLOAD_MAX_BPS", 0)) or None
+
+# Edge events are stored locally first and forwarded in batches
+CLOUD_INSERT_URL = os.environ.get("CLOUD_INSERT_URL", "https://axentry-backend.onrender.com/insert")
+EDGE_NODE_ID = os.environ.get("EDGE_NODE_ID", socket.gethostname())
+SYNC_BATCH_SIZE = int(os.environ.get("SYNC_BATCH_SIZE", 100))
+CLOUD_HEARTBEAT_URL = os.environ.get("CLOUD_HEARTBEAT_URL", "https://axentry-backend.onrender.com/heartbeat")
+HEARTBEAT_INTERVAL = float(os.environ.get("HEARTBEAT_INTERVAL", 30))
+# "compact" (column-wise msgpack/JSON batch, gzip) or "json"
+SYNC_WIRE = os.environ.get("SYNC_WIRE", "compact")
+
+# /debug/profile is disabled unless a token is set
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN")
+PROFILE_MAX_SECONDS = 60
+# Formats each mode can return; the first is the default
+PROFILE_FORMATS = {
+ "sample": ("text",),
+ "cprofile": ("pstats", "text"),
+ "memory": ("text", "snapshot"),
+}
+
 os.makedirs("clips", exist_ok=True)
 
 # -------------------------------
@@ -88,59 +178,209 @@ os.makedirs("clips", exist_ok=True)
 
 @app.route("/insert", methods=["POST"])
 def insert_event():
- data = request.json
-
- cursor.execute("""
- INSERT INTO events (timestamp, status, clip_path, camera_id)
- VALUES (?, ?, ?, ?)
- """, (
- data["timestamp"],
- data["status"],
- data.get("clip_path"),
- data["camera_id"]
- ))
-
- conn.commit()
- return {"success": True}
+ # A single event, or {"events": [...]} batches from edge sync as JSON or
+ # the compact (msgpack / gzip) batch format
+ try:
+  data = event_wire.decode(
+   request.get_data(),
+   request.content_type,
+   request.headers.get("Content-Encoding")
+  )
+ except event_wire.WireError as e:
+  return {"success": False, "error": str(e)}, 400
+ events = data["events"] if "events" in data else [data]
+
+ for e in events:
+  if not all(e.get(k) for k in ("timestamp", "status", "camera_id")):
+   return {"success": False, "error": "timestamp, status and camera_id are required"}, 400
+
+ inserted, duplicate = events_db.insert_events(
+  conn, events,
+  idempotency_key=request.headers.get("Idempotency-Key")
+ )
+ return {"success": True, "inserted": inserted, "duplicate": duplicate}
 
 @app.route("/scan", methods=["POST"])
 def trigger_scan():
- global scan_triggered
- scan_triggered = True
+ # Queued in the database so it reaches the vision loop from any worker
+ data = request.get_json(silent=True) or {}
+ db = scan_channel.connect(DB_PATH)
+ try:
+  scan_channel.request_scan(db, data.get("camera_id", CAMERA_ID))
+ finally:
+  db.close()
  return {"status": "scan received"}, 200
 
+@app.route("/status")
+def tracker_status():
+ db = scan_channel.connect(DB_PATH)
+ try:
+  return jsonify({
+   "cameras": scan_channel.read_state(db),
+   "pending_scans": scan_channel.pending_count(db)
+  })
+ finally:
+  db.close()
+
 @app.route("/events")
+@events_cache.cached
 def get_events():
     page = int(request.args.get("page", 1))
     limit = int(request.args.get("limit", 10))
     offset = (page - 1) * limit
 
-    cursor.execute("SELECT COUNT(*) FROM events")
+    # Optional camera_id / status / since / until filters
+    where, params = events_db.filter_clause(request.args)
+
+    cursor.execute(f"SELECT COUNT(*) FROM events{where}", params)
     total = cursor.fetchone()[0]
 
-    cursor.execute("""
-        SELECT * FROM events
+    fields = events_db.EVENT_FIELDS
+    cursor.execute(f"""
+        SELECT {', '.join(fields)}
+        FROM events{where}
         ORDER BY id DESC
         LIMIT ? OFFSET ?
-    """, (limit, offset))
+    """, params + [limit, offset])
 
     rows = cursor.fetchall()
 
-    return jsonify({
-        "total": total,
-        "page": page,
-        "limit": limit,
-        "events": [
-            {
-                "id": r[0],
-                "timestamp": r[1],
-                "status": r[2],
-                "clip_path": r[3],
-                "camera_id": r[4]
-            } for r in rows
-        ]
-    })
+    # format=columns returns {"columns": [...], "rows": [[...]]} for large pages
+    payload = {"total": total, "page": page, "limit": limit}
+    payload.update(event_json.rows_payload(fields, rows, columns=request.args.get("format") == "columns"))
+    return Response(event_json.dumps(payload), mimetype="application/json")
+
+
+@app.route("/events/export")
+def export_events():
+    # Streams every matching event, archived months included, oldest first,
+    # as NDJSON (default) or CSV without building the list in memory
+    fmt = request.args.get("format", "ndjson")
+    if fmt not in ("ndjson", "csv"):
+        return {"error": "format must be ndjson or csv"}, 400
+
+    filters = {k: request.args.get(k) for k in events_db.FILTER_ARGS}
+    fields = events_db.EVENT_FIELDS
+
+    def generate():
+        db = events_db.connect(DB_PATH)
+        try:
+            where, params = events_db.filter_clause(filters)
+            if fmt == "csv":
+                buf = io.StringIO()
+                writer = csv.writer(buf)
+                writer.writerow(fields)
+                yield buf.getvalue()
+
+            for table in event_archive.partitions(db, filters["since"], filters["until"]):
+                cur = db.execute(f"SELECT {', '.join(fields)} FROM {table}{where} ORDER BY id", params)
+                while True:
+                    rows = cur.fetchmany(1000)
+                    if not rows:
+                        break
+                    if fmt == "csv":
+                        buf.seek(0)
+                        buf.truncate()
+                        writer.writerows(rows)
+                        yield buf.getvalue()
+                    else:
+                        yield event_json.ndjson_lines(fields, rows)
+        finally:
+            db.close()
+
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return Response(
+        generate(),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=events.{fmt}"}
+    )
+
+@app.route("/rollups")
+@events_cache.cached
+def get_rollups():
+    # Hourly / daily counts per camera and status, including archived events
+    return jsonify(event_archive.rollups(
+        conn,
+        granularity=request.args.get("granularity", "day"),
+        since=request.args.get("since"),
+        until=request.args.get("until"),
+        camera_id=request.args.get("camera_id")
+    ))
+
+@app.route("/heartbeat", methods=["POST"])
+def node_heartbeat():
+ # Edge nodes report their cameras' tracker state and sync backlog
+ data = request.get_json(silent=True) or {}
+ if not data.get("node_id") or not isinstance(data.get("cameras"), dict):
+  return {"success": False, "error": "node_id and cameras are required"}, 400
+
+ utc_offset = data.get("utc_offset")
+ if utc_offset is not None and (
+  isinstance(utc_offset, bool) or not isinstance(utc_offset, (int, float)) or abs(utc_offset) > 18 * 3600
+ ):
+  return {"success": False, "error": "utc_offset must be seconds east of UTC"}, 400
+
+ db = events_db.connect(DB_PATH)
+ try:
+  count = camera_status.heartbeat(db, data["node_id"], data["cameras"], data.get("backlog"),
+                                  None if utc_offset is None else int(utc_offset))
+ finally:
+  db.close()
+ return {"success": True, "cameras": count}
+
+@app.route("/cameras")
+def list_cameras():
+ # Latest event, today's counts and heartbeat per camera, without touching events
+ db = events_db.connect(DB_PATH)
+ try:
+  return jsonify(camera_status.list_cameras(db, stale_after=HEARTBEAT_INTERVAL * 3))
+ finally:
+  db.close()
+
+@app.route("/metrics")
+def get_metrics():
+ return jsonify(metrics.snapshot())
+
+@app.route("/debug/profile")
+def debug_profile():
+    # ?mode=sample|cprofile|memory&seconds=N, with "Authorization: Bearer <PROFILE_TOKEN>"
+    auth = request.headers.get("Authorization", "")
+    if not PROFILE_TOKEN:
+        return {"error": "profiling is disabled"}, 404
+    if not hmac.compare_digest(auth.encode(), f"Bearer {PROFILE_TOKEN}".encode()):
+        return {"error": "unauthorized"}, 401
+
+    mode = request.args.get("mode", "sample")
+    if mode not in PROFILE_FORMATS:
+        return {"error": "mode must be sample, cprofile or memory"}, 400
+    fmt = request.args.get("format") or PROFILE_FORMATS[mode][0]
+    if fmt not in PROFILE_FORMATS[mode]:
+        return {"error": f"format must be one of {', '.join(PROFILE_FORMATS[mode])} for {mode}"}, 400
+    try:
+        seconds = float(request.args.get("seconds", 10))
+    except ValueError:
+        return {"error": "seconds must be a number"}, 400
+    # Written so that nan fails too
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        return {"error": f"seconds must be above 0 and at most {PROFILE_MAX_SECONDS}"}, 400
 
+    try:
+        if mode == "sample":
+            return Response(profiler.sample(seconds), mimetype="text/plain")
+        if mode == "cprofile":
+            body = profiler.cprofile(seconds, fmt)
+        else:
+            body = profiler.memory(seconds, fmt)
+    except profiler.Busy as e:
+        return {"error": str(e)}, 409
+
+    if fmt == "text":
+        return Response(body, mimetype="text/plain")
+    return Response(
+        body,
+        mimetype="application/octet-stream",
+        headers={"Content-Disposition": f"attachment; filename=profile.{fmt}"}
+    )
 
 @app.route("/dashboard")
 def dashboard():
@@ -169,10 +409,119 @@ if os.environ.get("RENDER") != "true":
 
  print("🚀 Local AI + Scan system running")
 
+ vision_db = scan_channel.connect(DB_PATH)
+ scan_latency = None
+
+ # /status shows the negotiated capture settings before the first scan
+ scan_channel.publish_state(vision_db, CAMERA_ID,
+  scanning=False, last_status=None, capture=camera.info)
+
+ storage = clip_storage.ClipStorage(
+  DB_PATH, "clips",
+  max_bytes=CLIP_QUOTA_BYTES,
+  max_age=CLIP_MAX_AGE_DAYS * 86400
+ )
+ storage.sync_dir()
+ storage.enforce()
+
+ # One uploader per Cloudinary resource type, sharing one bandwidth cap
+ upload_throttle = clip_uploader.Throttle(UPLOAD_MAX_BPS)
+ uploaders = {}
+ for resource_type in ("video", "image", "raw"):
+  if UPLOAD_BACKEND == "local":
+   upload_backend = clip_uploader.LocalBackend(UPLOAD_LOCAL_DIR)
+  else:
+   upload_backend = clip_uploader.CloudinaryBackend(resource_type)
+  uploaders[resource_type] = clip_uploader.ChunkedUploader(
+   upload_backend,
+   chunk_size=UPLOAD_CHUNK_BYTES,
+   throttle=upload_throttle
+  )
+
+ outbox_db = events_db.connect(DB_PATH)
+ outbox_lock = threading.Lock()
+
+ def send_event(event):
+  # Stored locally first; the sync worker forwards it when the uplink allows
+  with outbox_lock:
+   edge_sync.record_event(outbox_db, event)
+
+ def update_event(event_uid, links):
+  # Links filled in after the verdict are forwarded again
+  with outbox_lock:
+   edge_sync.update_event(outbox_db, event_uid, links)
+
+ sync_worker = edge_sync.SyncWorker(
+  DB_PATH, CLOUD_INSERT_URL, EDGE_NODE_ID,
+  batch_size=SYNC_BATCH_SIZE,
+  wire=SYNC_WIRE,
+  heartbeat_url=CLOUD_HEARTBEAT_URL,
+  heartbeat_interval=HEARTBEAT_INTERVAL
+ )
+ sync_worker.start()
+
+ def link_upload(path, url, owner, links):
+  # Runs on the upload queue's thread once a queued file is uploaded
+  for event_uid, field in links:
+   update_event(event_uid, {field: url})
+  if any(field == "clip_path" for _, field in links):
+   # Once uploaded the clip may be evicted first
+   storage.mark_uploaded(owner)
+   storage.enforce()
+
+ # Failed uploads are retried with backoff, also after a restart
+ upload_queue = clip_uploader.UploadQueue(DB_PATH, uploaders, link_upload)
+ upload_queue.start()
+
+ def finish_clip(job):
+  # Runs on the recorder's completion thread once the post-roll has been written
+  files = [
+   ("clip_path", job.upload_path, "video"),
+   ("poster_path", job.artifact_paths.get("poster_path"), "image"),
+   ("strip_path", job.artifact_paths.get("strip_path"), "image"),
+   ("index_path", job.artifact_paths.get("index_path"), "raw"),
+  ]
+
+  # Track the clip and its side files
+  storage.register(
+   job.path,
+   [job.upload_path] + list(job.artifact_paths.values())
+   + [e["telemetry_path"] for e in job.events if e.get("telemetry_path")]
+  )
+  storage.enforce()
+
+  # The events were stored at their verdicts; their links are added as the
+  # files are uploaded. Scan telemetry is one file per (merged) event
+  queued = []
+  for event in job.events:
+   for field, path, resource_type in files:
+    if path:
+     queued.append((path, resource_type, event["event_uid"], field, job.path))
+   if event.get("telemetry_path"):
+    queued.append((event["telemetry_path"], "raw", event["event_uid"], "telemetry_path", job.path))
+  upload_queue.add(queued)
+
+ recorder = clip_writer.ClipRecorder(
+  FPS, finish_clip,
+  upload_fps=UPLOAD_FPS,
+  upload_scale=UPLOAD_SCALE,
+  encoder=CLIP_ENCODER
+ )
+
+ scheduler = motion_tracker.DetectionScheduler(DETECT_MAX_INTERVAL)
+ predictor = motion_tracker.BoxPredictor()
+ load = load_control.LoadController(FRAME_LATENCY_TARGET_MS)
+
+ # Per-frame telemetry ring; each scan's frames are saved with its verdict
+ flight = flight_recorder.FlightRecorder(capacity=FPS * BUFFER_SECONDS * 4)
+
  while True:
-  ret, frame = cap.read()
+  read_started = time.time()
+  # Blocks through camera outages; False only after camera.stop()
+  ret, frame = camera.read()
   if not ret:
    break
+  frame_time = time.time()
 
   h, w, _ = frame.shape
 
@@ -181,19 +530,28 @@ if os.environ.get("RENDER") != "true":
   dy1 = 0
   dy2 = h
 
-  buffer.append(frame.copy())
+  raw = frame.copy()
 
   # 🔵 Blue zone
   cv2.rectangle(frame, (dx1, dy1), (dx2, dy2), (255, 0, 0), 2)
 
-  results = model.track(frame, conf=0.5, classes=[0], persist=True, verbose=False)
+  level = load.level
+
+  detected = scheduler.should_detect(raw, scanning, min_interval=level.detect_interval)
+  detect_started = time.time()
 
-  ids = []
-  boxes = []
+  if detected:
+   ids, boxes = detector.track(frame, imgsz=level.imgsz)
+   predictor.update(ids, boxes)
+  else:
+   ids, boxes = predictor.predict()
 
-  if results[0].boxes.id is not None:
-   ids = results[0].boxes.id.cpu().tolist()
-   boxes = results[0].boxes.xyxy.cpu().tolist()
+  detect_ms = (time.time() - detect_started) * 1000
+
+  entry = clip_writer.BufferedFrame(frame_time, raw, ids, boxes)
+  buffer.append(entry)
+  recorder.feed(entry)
+  metrics.set_gauge("capture.loop_fps", round(buffer.measured_fps() or 0, 1))
 
   valid_ids = set()
 
@@ -212,13 +570,27 @@ if os.environ.get("RENDER") != "true":
    if dx1 < cx < dx2 and dy1 < cy < dy2:
     valid_ids.add(tid)
 
-  if scan_triggered and not scanning:
+  flight.add(frame_time, ids, boxes, valid_ids, detected,
+   read_ms=(frame_time - read_started) * 1000,
+   detect_ms=detect_ms)
+
+  claim = None if scanning else scan_channel.claim_scan(vision_db, CAMERA_ID)
+
+  if claim is not None:
    scanning = True
-   scan_start = time.time()
+   # The claim frame is the scan's first frame; on its clock so the saved
+   # telemetry includes it
+   scan_start = frame_time
    flagged = False
    primary_id = None
    secondary_detect_time = None
-   scan_triggered = False
+   secondary_seen_ids = set()
+   scan_latency = claim[1]
+   print(f"Scan {claim[0]} picked up after {scan_latency * 1000:.1f} ms")
+   scan_channel.publish_state(vision_db, CAMERA_ID,
+    scanning=True, last_status=last_status,
+    last_scan_latency_ms=round(scan_latency * 1000, 1),
+    capture=camera.info)
 
   if scanning:
    elapsed = time.time() - scan_start
@@ -232,13 +604,18 @@ if os.environ.get("RENDER") != "true":
     secondary_ids = set()
 
    if len(secondary_ids) > 0:
+    secondary_seen_ids |= secondary_ids
+    # Frame capture times, the clock flight_recorder.replay() checks with
     if secondary_detect_time is None:
-     secondary_detect_time = time.time()
-    elif time.time() - secondary_detect_time >= TOLERANCE_SECONDS:
+     secondary_detect_time = frame_time
+    elif frame_time - secondary_detect_time >= TOLERANCE_SECONDS:
      flagged = True
    else:
     secondary_detect_time = None
 
+   flight.set(scanning=True, primary_id=primary_id,
+    secondary_t=secondary_detect_time, flagged=flagged)
+
    cv2.putText(frame,
    f"Scanning... {round(3 - elapsed, 1)}s",
    (20, 40),
@@ -250,48 +627,57 @@ if os.environ.get("RENDER") != "true":
     readable_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     status = "UNAUTHORIZED" if flagged else "VERIFIED"
-    clip_url = None
+    event = {
+     "event_uid": events_db.new_event_uid(CAMERA_ID),
+     "timestamp": readable_time,
+     "status": status,
+     "clip_path": None,
+     "camera_id": CAMERA_ID
+    }
+
+    # The scan's per-frame telemetry, so the verdict can be audited and
+    # replayed offline (flight_recorder.py)
+    telemetry_path = os.path.join("clips", f"scan_{event['event_uid']}.npz")
+    try:
+     flight.save(telemetry_path, scan_start, frame_time, {
+      "event_uid": event["event_uid"],
+      "camera_id": CAMERA_ID,
+      "status": status,
+      "scan_start": scan_start,
+      "verdict_at": frame_time,
+      "tolerance_seconds": TOLERANCE_SECONDS,
+      "door_zone": [dx1, dx2, dy1, dy2],
+      "frame_size": [w, h],
+      "secondary_seen_ids": sorted(int(i) for i in secondary_seen_ids),
+      "load_level": load.index,
+     })
+     event["telemetry_path"] = telemetry_path
+    except Exception as e:
+     print("Telemetry error:", e)
 
-    # 🎥 Only upload if unauthorized
+    # ✅ ALWAYS send event, straight away so a crash during the clip's
+    # post-roll or upload cannot lose it; the clip links follow later
+    send_event(event)
+
+    # 🎥 Only record if unauthorized
     if flagged:
      ts = datetime.now().strftime("%Y%m%d_%H%M%S")
      filename = f"event_{ts}.mp4"
      path = os.path.join("clips", filename)
 
-     h, w, _ = frame.shape
-     out = cv2.VideoWriter(
-      path,
-      cv2.VideoWriter_fourcc(*"mp4v"),
-      FPS,
-      (w, h)
-     )
-
-     for f in buffer:
-      out.write(f)
-
-     out.release()
-
-     upload_result = cloudinary.uploader.upload(
-      path,
-      resource_type="video"
-     )
-
-     clip_url = upload_result["secure_url"]
+     # First frame the tailgater appears in, even outside the door zone
+     event_start = clip_writer.first_seen(buffer, secondary_seen_ids)
 
-    # ✅ ALWAYS send event
-    try:
-     requests.post(
-      "https://axentry-backend.onrender.com/insert",
-      json={
-       "timestamp": readable_time,
-       "status": status,
-       "clip_path": clip_url,
-       "camera_id": "CAM_01"
-      },
-      timeout=3
+     recorder.start(
+      path, buffer,
+      event_start, frame_time, event,
+      pre_roll=CLIP_PRE_ROLL_SECONDS,
+      post_roll=CLIP_POST_ROLL_SECONDS
      )
-    except Exception as e:
-     print("Cloud error:", e)
+    elif event.get("telemetry_path"):
+     # Stays on the edge only (sync does not forward local paths); nothing
+     # to upload, so it may be evicted first
+     storage.register(event["telemetry_path"], uploaded=True)
 
     # Overlay result
     if flagged:
@@ -303,6 +689,11 @@ if os.environ.get("RENDER") != "true":
 
     status_display_until = time.time() + 3
 
+    scan_channel.publish_state(vision_db, CAMERA_ID,
+     scanning=False, last_status=status,
+     last_scan_latency_ms=round(scan_latency * 1000, 1),
+     capture=camera.info)
+
   if time.time() < status_display_until and last_status:
    cv2.putText(frame,
    last_status,
@@ -312,10 +703,21 @@ if os.environ.get("RENDER") != "true":
    status_color,
    3)
 
-  cv2.imshow("Axentry Access Verification", frame)
+  if load.show_preview():
+   cv2.imshow("Axentry Access Verification", frame)
 
   if cv2.waitKey(1) & 0xFF == ord("q"):
    break
 
- cap.release()
+  loop_ms = (time.time() - frame_time) * 1000
+  load.observe(loop_ms)
+  flight.set(loop_ms=loop_ms)
+  profiler.checkpoint()
+
+ camera.stop()
+ detector.close()
+ recorder.flush()
+ upload_queue.stop()
+ sync_worker.stop()
+ vision_db.close()
  cv2.destroyAllWindows()
@@ -0,0 +1,313 @@
+import argparse
+import json
+import os
+import random
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import camera_status
+import event_archive
+import events_db
+import scan_channel
+
+# -------------------------------
+# EVENT API BENCHMARK
+# -------------------------------
+#
+# Seeds an events.db copy per size, starts app.py under gunicorn (RENDER=true,
+# so no camera / model loop) and drives concurrent /insert, /events and /scan
+# traffic against it. Results are printed (and optionally written) as JSON so
+# runs can be compared over time.
+#
+#   python benchmarks/bench_api.py --sizes 10k,1m --workers 1,4 --out bench.json
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(ROOT, "benchmarks", "data")
+
+STATUSES = ["VERIFIED", "VERIFIED", "VERIFIED", "UNAUTHORIZED"]
+CAMERAS = [f"CAM_{i:02d}" for i in range(1, 9)]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+ id INTEGER PRIMARY KEY AUTOINCREMENT,
+ timestamp TEXT,
+ status TEXT,
+ clip_path TEXT,
+ camera_id TEXT
+)
+"""
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    mult = {"k": 1_000, "m": 1_000_000}.get(text[-1])
+    return int(float(text[:-1]) * mult) if mult else int(text)
+
+
+def seed_rows(count):
+    start = datetime(2024, 1, 1)
+    rnd = random.Random(count)
+    for i in range(count):
+        status = rnd.choice(STATUSES)
+        ts = start + timedelta(seconds=i * 7)
+        clip = f"clips/event_{ts:%Y%m%d_%H%M%S}.mp4" if status == "UNAUTHORIZED" else None
+        yield (ts.strftime("%Y-%m-%d %H:%M:%S"), status, clip, rnd.choice(CAMERAS))
+
+
+def seed_db(count):
+    # Seeded files are reused between runs; a 10M-row seed takes a while.
+    os.makedirs(DATA_DIR, exist_ok=True)
+    path = os.path.join(DATA_DIR, f"events_{count}.db")
+    seed_path = path + ".seed"
+
+    if not os.path.exists(seed_path):
+        tmp = seed_path + ".tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+        db = sqlite3.connect(tmp)
+        db.execute("PRAGMA journal_mode=OFF")
+        db.execute("PRAGMA synchronous=OFF")
+        db.execute(SCHEMA)
+
+        rows = seed_rows(count)
+        chunk = 100_000
+        done = 0
+        while done < count:
+            n = min(chunk, count - done)
+            db.executemany(
+                "INSERT INTO events (timestamp, status, clip_path, camera_id) VALUES (?, ?, ?, ?)",
+                (next(rows) for _ in range(n))
+            )
+            db.commit()
+            done += n
+            print(f"  seeded {done}/{count}", file=sys.stderr)
+
+        db.close()
+        os.replace(tmp, seed_path)
+
+    # Schema setup (indexes, rollup backfills) is done once on the seed, so
+    # the workers of each run boot against an up-to-date schema; a no-op
+    # once it has been done.
+    migrate(seed_path)
+
+    # Every run starts from the pristine seed so inserts don't accumulate.
+    with open(seed_path, "rb") as src, open(path, "wb") as dst:
+        while True:
+            block = src.read(1 << 20)
+            if not block:
+                break
+            dst.write(block)
+
+    return path
+
+
+def migrate(path):
+    # The schema setup app.py runs at import
+    db = sqlite3.connect(path)
+    try:
+        events_db.init(db)
+        event_archive.init(db)
+        camera_status.init(db)
+        scan_channel.init(db)
+    finally:
+        db.close()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(db_path, workers, port):
+    # No archiving: the seed's 2024 rows would be moved out of the hot
+    # table during the run, and the benchmark is about a large hot table
+    env = dict(os.environ, RENDER="true", EVENTS_DB=db_path, ARCHIVE_HOT_DAYS="0")
+    proc = subprocess.Popen(
+        [
+            sys.executable, "-m", "gunicorn",
+            "-w", str(workers),
+            "-b", f"127.0.0.1:{port}",
+            "--log-level", "warning",
+            "app:app",
+        ],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {proc.returncode}")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/dashboard", timeout=1).read()
+            return proc
+        except (urllib.error.URLError, ConnectionError, socket.timeout):
+            time.sleep(0.25)
+
+    proc.kill()
+    raise RuntimeError("gunicorn did not come up")
+
+
+def stop_server(proc):
+    proc.send_signal(signal.SIGTERM)
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def make_request(base, endpoint, rnd, max_page):
+    if endpoint == "/insert":
+        body = json.dumps({
+            "event_uid": uuid.uuid4().hex,
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "status": rnd.choice(STATUSES),
+            "clip_path": None,
+            "camera_id": rnd.choice(CAMERAS),
+        }).encode()
+        return urllib.request.Request(
+            base + "/insert", data=body, method="POST",
+            headers={"Content-Type": "application/json"}
+        )
+
+    if endpoint == "/scan":
+        return urllib.request.Request(base + "/scan", data=b"", method="POST")
+
+    # Mostly first-page reads like the dashboard, with some deep pagination.
+    page = 1 if rnd.random() < 0.8 else rnd.randint(1, max_page)
+    return urllib.request.Request(f"{base}/events?page={page}&limit=10")
+
+
+def percentile(sorted_vals, pct):
+    if not sorted_vals:
+        return None
+    idx = min(len(sorted_vals) - 1, int(round(pct / 100 * (len(sorted_vals) - 1))))
+    return sorted_vals[idx]
+
+
+def run_load(base, mix, concurrency, duration, rows):
+    endpoints = list(mix)
+    weights = [mix[e] for e in endpoints]
+    latencies = {e: [] for e in endpoints}
+    errors = {e: 0 for e in endpoints}
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+    max_page = max(1, rows // 10)
+
+    def client(seed):
+        rnd = random.Random(seed)
+        local = {e: [] for e in endpoints}
+        local_err = {e: 0 for e in endpoints}
+
+        while time.perf_counter() < stop_at:
+            endpoint = rnd.choices(endpoints, weights)[0]
+            req = make_request(base, endpoint, rnd, max_page)
+            t0 = time.perf_counter()
+            try:
+                with urllib.request.urlopen(req, timeout=30) as resp:
+                    resp.read()
+                local[endpoint].append(time.perf_counter() - t0)
+            except Exception:
+                local_err[endpoint] += 1
+
+        with lock:
+            for e in endpoints:
+                latencies[e].extend(local[e])
+                errors[e] += local_err[e]
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    report = {}
+    for e in endpoints:
+        vals = sorted(latencies[e])
+        report[e] = {
+            "requests": len(vals),
+            "errors": errors[e],
+            "throughput_rps": round(len(vals) / wall, 1),
+            "p50_ms": _ms(percentile(vals, 50)),
+            "p95_ms": _ms(percentile(vals, 95)),
+            "p99_ms": _ms(percentile(vals, 99)),
+            "max_ms": _ms(vals[-1] if vals else None),
+        }
+    return report
+
+
+def _ms(val):
+    return None if val is None else round(val * 1000, 2)
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, weight = part.split("=")
+        mix["/" + name.strip().lstrip("/")] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Axentry event API")
+    parser.add_argument("--sizes", default="10k,1m,10m", help="comma separated row counts (10k, 1m, 10m)")
+    parser.add_argument("--workers", default="1,2,4", help="comma separated gunicorn worker counts")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent client threads")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of load per run")
+    parser.add_argument("--mix", default="events=6,insert=3,scan=1", help="endpoint weights")
+    parser.add_argument("--out", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    report = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "concurrency": args.concurrency,
+        "duration_s": args.duration,
+        "mix": mix,
+        "runs": [],
+    }
+
+    for size in args.sizes.split(","):
+        rows = parse_size(size)
+        for workers in [int(w) for w in args.workers.split(",")]:
+            print(f"rows={rows} workers={workers}", file=sys.stderr)
+            db_path = seed_db(rows)
+            port = free_port()
+            proc = start_server(db_path, workers, port)
+            try:
+                endpoints = run_load(f"http://127.0.0.1:{port}", mix, args.concurrency, args.duration, rows)
+            finally:
+                stop_server(proc)
+
+            report["runs"].append({
+                "rows": rows,
+                "workers": workers,
+                "endpoints": endpoints,
+            })
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
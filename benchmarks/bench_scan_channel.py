@@ -0,0 +1,101 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scan_channel
+
+# -------------------------------
+# SCAN CHANNEL LATENCY BENCHMARK
+# -------------------------------
+#
+# Several producer processes (standing in for gunicorn workers) queue scans
+# while one consumer polls at the camera frame rate like the detection loop.
+# Reports queue latency and the per-frame cost of an empty poll.
+
+
+def producer(path, camera_id, count, interval):
+    db = scan_channel.connect(path)
+    for _ in range(count):
+        scan_channel.request_scan(db, camera_id)
+        time.sleep(interval)
+    db.close()
+
+
+def percentile(vals, pct):
+    vals = sorted(vals)
+    if not vals:
+        return None
+    return vals[min(len(vals) - 1, int(round(pct / 100 * (len(vals) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure /scan delivery latency across processes")
+    parser.add_argument("--producers", type=int, default=4)
+    parser.add_argument("--scans", type=int, default=50, help="scans per producer")
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between scans per producer")
+    parser.add_argument("--fps", type=float, default=30, help="consumer poll rate")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, "events.db")
+    db = scan_channel.connect(path)
+    scan_channel.init(db)
+
+    camera_id = "CAM_01"
+    total = args.producers * args.scans
+    procs = [
+        multiprocessing.Process(target=producer, args=(path, camera_id, args.scans, args.interval))
+        for _ in range(args.producers)
+    ]
+    for p in procs:
+        p.start()
+
+    latencies = []
+    empty_polls = []
+    frame = 1.0 / args.fps
+    deadline = time.time() + 60 + total * args.interval
+
+    while len(latencies) < total and time.time() < deadline:
+        t0 = time.perf_counter()
+        claim = scan_channel.claim_scan(db, camera_id, max_age=3600)
+        cost = time.perf_counter() - t0
+
+        if claim is None:
+            empty_polls.append(cost)
+        else:
+            latencies.append(claim[1])
+            # Drain everything that is already queued, like back-to-back scans.
+            continue
+
+        time.sleep(max(0.0, frame - cost))
+
+    for p in procs:
+        p.join()
+    db.close()
+
+    print(json.dumps({
+        "producers": args.producers,
+        "scans": total,
+        "delivered": len(latencies),
+        "poll_fps": args.fps,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "max": round(max(latencies) * 1000, 2),
+        },
+        "empty_poll_us": {
+            "p50": round(percentile(empty_polls, 50) * 1e6, 1),
+            "p99": round(percentile(empty_polls, 99) * 1e6, 1),
+        },
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import event_json
+import events_db
+
+# -------------------------------
+# EVENTS SERIALIZATION BENCHMARK
+# -------------------------------
+#
+# Compares the old per-row dict-by-index + stdlib JSON path (what jsonify
+# did) with the event_json paths on a large /events page: latency (median
+# of several runs, query included) and peak traced memory.
+
+
+def seed(rows):
+    db = sqlite3.connect(":memory:")
+    events_db.init(db)
+    db.executemany(
+        "INSERT INTO events (timestamp, status, clip_path, camera_id, event_uid) VALUES (?, ?, ?, ?, ?)",
+        (
+            (f"2024-01-01 00:{i // 60 % 60:02d}:{i % 60:02d}", "UNAUTHORIZED" if i % 4 == 0 else "VERIFIED",
+             f"https://res.cloudinary.com/demo/video/upload/event_{i}.mp4" if i % 4 == 0 else None,
+             f"CAM_{i % 8:02d}", f"CAM_{i % 8:02d}-{i:032x}")
+            for i in range(rows)
+        )
+    )
+    db.commit()
+    return db
+
+
+def fetch(db, rows):
+    fields = events_db.EVENT_FIELDS
+    return fields, db.execute(f"SELECT {', '.join(fields)} FROM events ORDER BY id DESC LIMIT ?", (rows,)).fetchall()
+
+
+def legacy(db, rows):
+    _, data = fetch(db, rows)
+    return json.dumps({
+        "events": [
+            {
+                "id": r[0], "timestamp": r[1], "status": r[2], "clip_path": r[3],
+                "camera_id": r[4], "poster_path": r[5], "strip_path": r[6],
+                "index_path": r[7], "event_uid": r[8], "telemetry_path": r[9],
+            } for r in data
+        ]
+    }, indent=None).encode()
+
+
+def zipped(db, rows):
+    fields, data = fetch(db, rows)
+    return event_json.dumps(event_json.rows_payload(fields, data))
+
+
+def columns(db, rows):
+    fields, data = fetch(db, rows)
+    return event_json.dumps(event_json.rows_payload(fields, data, columns=True))
+
+
+def measure(fn, db, rows, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        body = fn(db, rows)
+        times.append(time.perf_counter() - t0)
+
+    tracemalloc.start()
+    fn(db, rows)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "median_ms": round(statistics.median(times) * 1000, 2),
+        "min_ms": round(min(times) * 1000, 2),
+        "peak_kib": round(peak / 1024),
+        "bytes": len(body),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /events serialization paths")
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=15)
+    parser.add_argument("--stdlib", action="store_true", help="ignore orjson even if installed")
+    args = parser.parse_args()
+
+    if args.stdlib:
+        event_json.orjson = None
+
+    db = seed(args.rows)
+    print(json.dumps({
+        "rows": args.rows,
+        "encoder": "orjson" if event_json.orjson is not None else "stdlib json",
+        "results": {
+            "legacy_dict_by_index": measure(legacy, db, args.rows, args.repeat),
+            "zipped_dicts": measure(zipped, db, args.rows, args.repeat),
+            "columns": measure(columns, db, args.rows, args.repeat),
+        },
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
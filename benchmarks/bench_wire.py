@@ -0,0 +1,154 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import event_wire
+import events_db
+
+# -------------------------------
+# EDGE -> CLOUD WIRE FORMAT COMPARISON
+# -------------------------------
+#
+# Bytes per event and requests per 1000 events for the ways an edge node
+# can ship events to /insert: the old one JSON body per event, JSON
+# batches (plain and gzip) and the compact event_wire batches (JSON or
+# msgpack container, gzip or zstd). Also times encode + decode. Request
+# overhead is an estimate: REQUEST_OVERHEAD bytes of HTTP headers per
+# request, plus TLS_HANDSHAKE bytes per connection, with one connection
+# per request for the old per-event path and one kept-alive connection
+# for batches.
+#
+#   python benchmarks/bench_wire.py --events 10000 --batch 100
+
+REQUEST_OVERHEAD = 350
+TLS_HANDSHAKE = 5000
+
+CAMERAS = [f"CAM_{i:02d}" for i in range(1, 9)]
+
+
+def make_events(count, seed=1):
+    rnd = random.Random(seed)
+    start = datetime(2024, 6, 1, 8)
+    events = []
+    for i in range(count):
+        camera = rnd.choice(CAMERAS)
+        ts = start + timedelta(seconds=i * rnd.randint(5, 40))
+        unauthorized = rnd.random() < 0.1
+        uid = events_db.new_event_uid(camera)
+        event = {
+            "event_uid": uid,
+            "timestamp": ts.strftime("%Y-%m-%d %H:%M:%S"),
+            "status": "UNAUTHORIZED" if unauthorized else "VERIFIED",
+            "clip_path": None,
+            "camera_id": camera,
+            "telemetry_path": f"clips/scan_{uid}.npz",
+        }
+        if unauthorized:
+            base = f"https://res.cloudinary.com/dcr5izjyl/video/upload/v1717200000/event_{ts:%Y%m%d_%H%M%S}"
+            event.update(
+                clip_path=base + ".mp4",
+                poster_path=base.replace("/video/", "/image/") + ".jpg",
+                strip_path=base.replace("/video/", "/image/") + "_strip.jpg",
+                index_path=base.replace("/video/", "/raw/") + ".json",
+            )
+        events.append(event)
+    return events
+
+
+def batches(events, size):
+    return [events[i:i + size] for i in range(0, len(events), size)]
+
+
+def json_body(payload, gzip_it=False):
+    body = json.dumps(payload).encode()
+    if gzip_it:
+        import zlib
+        packer = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        body = packer.compress(body) + packer.flush()
+    return body
+
+
+def measure(name, events, size, encode, decode, per_event_connection=False):
+    started = time.perf_counter()
+    bodies = [encode(chunk) for chunk in batches(events, size)]
+    encoded = time.perf_counter()
+    for body, headers in bodies:
+        decode(body, headers)
+    decoded = time.perf_counter()
+
+    body_bytes = sum(len(b) for b, _ in bodies)
+    requests_ = len(bodies)
+    connections = requests_ if per_event_connection else 1
+    wire_bytes = body_bytes + requests_ * REQUEST_OVERHEAD + connections * TLS_HANDSHAKE
+    n = len(events)
+
+    return {
+        "format": name,
+        "batch": size,
+        "body_bytes_per_event": round(body_bytes / n, 1),
+        "est_wire_bytes_per_event": round(wire_bytes / n, 1),
+        "requests_per_1000_events": round(requests_ / n * 1000, 1),
+        "encode_us_per_event": round((encoded - started) / n * 1e6, 2),
+        "decode_us_per_event": round((decoded - encoded) / n * 1e6, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare edge -> cloud event wire formats")
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--batch", type=int, default=100)
+    args = parser.parse_args()
+
+    events = make_events(args.events)
+    json_headers = {"Content-Type": "application/json"}
+    gzip_headers = dict(json_headers, **{"Content-Encoding": "gzip"})
+
+    def decode(body, headers):
+        return event_wire.decode(body, headers["Content-Type"], headers.get("Content-Encoding"))
+
+    results = [
+        measure("json per event (old)", events, 1,
+                lambda chunk: (json_body(chunk[0]), json_headers), decode,
+                per_event_connection=True),
+        measure("json batch", events, args.batch,
+                lambda chunk: (json_body({"events": chunk}), json_headers), decode),
+        measure("json batch gzip", events, args.batch,
+                lambda chunk: (json_body({"events": chunk}, True), gzip_headers), decode),
+    ]
+
+    container = "msgpack" if event_wire.msgpack is not None else "json"
+    results.append(measure(f"compact {container}", events, args.batch,
+                           lambda chunk: event_wire.encode(chunk, compression=None), decode))
+    results.append(measure(f"compact {container} gzip", events, args.batch,
+                           lambda chunk: event_wire.encode(chunk, compression="gzip"), decode))
+    if event_wire.zstandard is not None:
+        results.append(measure(f"compact {container} zstd", events, args.batch,
+                               lambda chunk: event_wire.encode(chunk, compression="zstd"), decode))
+
+    # Round trip check: the compact path must give back the same events
+    body, headers = event_wire.encode(events[:args.batch])
+    back = decode(body, headers)["events"]
+    same = all(
+        {k: v for k, v in a.items() if v is not None} == {k: v for k, v in b.items() if v is not None}
+        for a, b in zip(events, back)
+    )
+
+    print(json.dumps({
+        "events": args.events,
+        "msgpack": event_wire.msgpack is not None,
+        "zstd": event_wire.zstandard is not None,
+        "round_trip_ok": same,
+        "assumed_request_overhead_bytes": REQUEST_OVERHEAD,
+        "assumed_tls_handshake_bytes": TLS_HANDSHAKE,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
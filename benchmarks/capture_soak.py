@@ -0,0 +1,155 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+
+import camera_capture
+import metrics
+
+# -------------------------------
+# CAPTURE WATCHDOG SOAK TEST
+# -------------------------------
+#
+# Drives CaptureSupervisor with a file source wrapped in FlakyCapture, which
+# randomly fails reads, stalls, freezes the picture and refuses to reopen,
+# the way a USB camera or RTSP stream misbehaves. The consumer must keep
+# receiving frames throughout; the report shows how many outages there were
+# and how long recovery took.
+#
+#   python benchmarks/capture_soak.py --frames 3000 [--video clip.mp4]
+
+
+class FlakyCapture:
+    def __init__(self, path, rnd, fail_rate, freeze_rate, stall_rate):
+        self.cap = cv2.VideoCapture(path)
+        self.rnd = rnd
+        self.fail_rate = fail_rate
+        self.freeze_rate = freeze_rate
+        self.stall_rate = stall_rate
+        self.frozen = 0
+        self.last = None
+
+    def read(self):
+        if self.frozen:
+            # Driver keeps handing out the same buffer
+            self.frozen -= 1
+            time.sleep(0.005)
+            return True, self.last.copy()
+
+        roll = self.rnd.random()
+        if roll < self.fail_rate:
+            return False, None
+        if roll < self.fail_rate + self.stall_rate:
+            # A backend read timeout: slow, then a failed read
+            time.sleep(0.2)
+            return False, None
+        if roll < self.fail_rate + self.stall_rate + self.freeze_rate:
+            self.frozen = 400
+
+        ret, frame = self.cap.read()
+        if not ret:
+            # End of file: loop, like a stream that keeps going
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        self.last = frame
+        return ret, frame
+
+    def release(self):
+        self.cap.release()
+
+
+def make_video(path, frames=300, size=(320, 240)):
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 30, size)
+    rnd = np.random.default_rng(0)
+    for i in range(frames):
+        img = rnd.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8)
+        cv2.putText(img, str(i), (10, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+        out.write(img)
+    out.release()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak test the camera watchdog against a flaky source")
+    parser.add_argument("--video", help="source file (a synthetic one is generated if omitted)")
+    parser.add_argument("--frames", type=int, default=3000)
+    parser.add_argument("--fail-rate", type=float, default=0.002)
+    parser.add_argument("--stall-rate", type=float, default=0.001)
+    parser.add_argument("--freeze-rate", type=float, default=0.0005)
+    parser.add_argument("--open-fail-rate", type=float, default=0.3)
+    parser.add_argument("--freeze-seconds", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    video = args.video
+    if not video:
+        video = os.path.join(tempfile.mkdtemp(), "soak.mp4")
+        make_video(video)
+
+    rnd = random.Random(args.seed)
+    settings = camera_capture.CaptureSettings(
+        source=video, mode="default", width=None, height=None,
+        fps=None, fourcc=None, buffer_size=None, imgsz=640,
+    )
+
+    opens = [0]
+
+    def opener(settings):
+        # The first open is not under test; reopens fail now and then
+        opens[0] += 1
+        if opens[0] > 1 and rnd.random() < args.open_fail_rate:
+            raise RuntimeError("simulated open failure")
+        cap = FlakyCapture(settings.source, rnd, args.fail_rate, args.freeze_rate, args.stall_rate)
+        return cap, {"source": settings.source}
+
+    camera = camera_capture.CaptureSupervisor(
+        settings, opener=opener,
+        freeze_seconds=args.freeze_seconds,
+        backoff=0.05, max_backoff=0.5,
+    )
+
+    recoveries = []
+    delivered = 0
+    longest_gap = 0.0
+    last = time.time()
+    started = last
+
+    while delivered < args.frames:
+        reconnects = metrics.get("capture.reconnects")
+        ret, frame = camera.read()
+        if not ret:
+            break
+        now = time.time()
+        if metrics.get("capture.reconnects") != reconnects:
+            recoveries.append(metrics.get("capture.last_recovery_s"))
+        longest_gap = max(longest_gap, now - last)
+        last = now
+        delivered += 1
+
+    camera.stop()
+    recoveries.sort()
+
+    result = {
+        "frames": args.frames,
+        "delivered": delivered,
+        "elapsed_s": round(time.time() - started, 2),
+        "read_failures": metrics.get("capture.read_failures"),
+        "frozen": metrics.get("capture.frozen"),
+        "reconnects": metrics.get("capture.reconnects"),
+        "recovery_p50_s": recoveries[len(recoveries) // 2] if recoveries else None,
+        "recovery_max_s": recoveries[-1] if recoveries else None,
+        "longest_gap_s": round(longest_gap, 2),
+    }
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if delivered == args.frames else 1)
+
+
+if __name__ == "__main__":
+    main()
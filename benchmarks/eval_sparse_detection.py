@@ -0,0 +1,135 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+from ultralytics import YOLO
+
+import motion_tracker
+
+# -------------------------------
+# SPARSE DETECTION ACCURACY CHECK
+# -------------------------------
+#
+# Replays recorded clips twice: once with model.track on every frame (the
+# reference) and once in detect-every-N mode with Kalman-predicted boxes in
+# between. For each clip it reports box recall / precision at IoU 0.5, how
+# often the number of people inside the door zone agrees (what the
+# tailgating rule looks at) and the detector time saved.
+#
+#   python benchmarks/eval_sparse_detection.py clips/*.mp4 --max-interval 4
+
+
+def door_zone(w, h):
+    return int(w * 0.25), int(w * 0.75), 0, h
+
+
+def in_zone_count(boxes, zone):
+    dx1, dx2, dy1, dy2 = zone
+    count = 0
+    for x1, y1, x2, y2 in boxes:
+        cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+        if dx1 < cx < dx2 and dy1 < cy < dy2:
+            count += 1
+    return count
+
+
+def iou(a, b):
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, ix2 - ix1) * max(0.0, iy2 - iy1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def matches(ref, test, threshold=0.5):
+    used = set()
+    hit = 0
+    for r in ref:
+        best, best_j = threshold, None
+        for j, t in enumerate(test):
+            if j not in used and iou(r, t) >= best:
+                best, best_j = iou(r, t), j
+        if best_j is not None:
+            used.add(best_j)
+            hit += 1
+    return hit
+
+
+def run(path, weights, max_interval):
+    model = YOLO(weights)
+    scheduler = motion_tracker.DetectionScheduler(max_interval)
+    predictor = motion_tracker.BoxPredictor()
+    cap = cv2.VideoCapture(path)
+    frames = []
+    detect_time = 0.0
+
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+
+        if scheduler.should_detect(frame):
+            t0 = time.perf_counter()
+            results = model.track(frame, conf=0.5, classes=[0], persist=True, verbose=False)
+            detect_time += time.perf_counter() - t0
+
+            ids, boxes = [], []
+            if results[0].boxes.id is not None:
+                ids = results[0].boxes.id.cpu().tolist()
+                boxes = results[0].boxes.xyxy.cpu().tolist()
+            predictor.update(ids, boxes)
+        else:
+            ids, boxes = predictor.predict()
+
+        frames.append((frame.shape, boxes))
+
+    cap.release()
+    return frames, detect_time
+
+
+def evaluate(path, weights, max_interval):
+    reference, ref_time = run(path, weights, 1)
+    sparse, sparse_time = run(path, weights, max_interval)
+
+    ref_boxes = test_boxes = hits_r = hits_t = agree = 0
+    for (shape, ref), (_, test) in zip(reference, sparse):
+        zone = door_zone(shape[1], shape[0])
+        ref_boxes += len(ref)
+        test_boxes += len(test)
+        hits_r += matches(ref, test)
+        hits_t += matches(test, ref)
+        agree += in_zone_count(ref, zone) == in_zone_count(test, zone)
+
+    n = min(len(reference), len(sparse))
+    return {
+        "clip": path,
+        "frames": n,
+        "recall": round(hits_r / ref_boxes, 4) if ref_boxes else None,
+        "precision": round(hits_t / test_boxes, 4) if test_boxes else None,
+        "zone_count_agreement": round(agree / n, 4) if n else None,
+        "detector_s_every_frame": round(ref_time, 2),
+        "detector_s_sparse": round(sparse_time, 2),
+        "detector_time_saved": round(1 - sparse_time / ref_time, 4) if ref_time else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare detect-every-N mode with every-frame detection")
+    parser.add_argument("clips", nargs="+")
+    parser.add_argument("--max-interval", type=int, default=4)
+    parser.add_argument("--weights", default="yolov8n.pt")
+    args = parser.parse_args()
+
+    print(json.dumps({
+        "max_interval": args.max_interval,
+        "clips": [evaluate(p, args.weights, args.max_interval) for p in args.clips],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import edge_sync
+import event_wire
+import events_db
+
+# -------------------------------
+# STORE-AND-FORWARD SOAK TEST
+# -------------------------------
+#
+# Runs the edge SyncWorker against a local stand-in for the cloud /insert
+# that randomly fails: some requests are rejected before anything is
+# stored, others are committed but the response is dropped, so the client
+# has to retry a batch the server already has. At the end every edge event
+# must exist on the server exactly once.
+
+
+def make_server(db_path, fail_before, fail_after):
+    db = events_db.connect(db_path)
+    events_db.init(db)
+    lock = threading.Lock()
+    stats = {"requests": 0, "rejected": 0, "dropped": 0, "duplicates": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = event_wire.decode(
+                self.rfile.read(int(self.headers["Content-Length"])),
+                self.headers.get("Content-Type"),
+                self.headers.get("Content-Encoding")
+            )
+            roll = random.random()
+
+            with lock:
+                stats["requests"] += 1
+                if roll < fail_before:
+                    stats["rejected"] += 1
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+
+                _, duplicate = events_db.insert_events(
+                    db, body["events"], idempotency_key=self.headers.get("Idempotency-Key")
+                )
+                stats["duplicates"] += duplicate
+
+            if roll < fail_before + fail_after:
+                # Committed, but the client never hears back.
+                stats["dropped"] += 1
+                self.close_connection = True
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b'{"success": true}')
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    return server, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak test edge event sync against a flaky server")
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=50)
+    parser.add_argument("--fail-before", type=float, default=0.2, help="share of requests rejected")
+    parser.add_argument("--fail-after", type=float, default=0.2, help="share committed but unanswered")
+    parser.add_argument("--wire", default="compact", choices=["compact", "json"])
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    tmp = tempfile.mkdtemp()
+    edge_path = os.path.join(tmp, "edge.db")
+    cloud_path = os.path.join(tmp, "cloud.db")
+
+    server, stats = make_server(cloud_path, args.fail_before, args.fail_after)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/insert"
+
+    edge = events_db.connect(edge_path)
+    events_db.init(edge)
+    worker = edge_sync.SyncWorker(edge_path, url, "soak", batch_size=args.batch, interval=0.05, max_backoff=0.2, timeout=2, wire=args.wire)
+    worker.start()
+
+    # Events keep arriving while the worker is retrying.
+    for i in range(args.events):
+        edge_sync.record_event(edge, {
+            "event_uid": events_db.new_event_uid("SOAK"),
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "status": "UNAUTHORIZED" if i % 5 == 0 else "VERIFIED",
+            "camera_id": f"SOAK_{i:06d}",
+        })
+        if i % 100 == 0:
+            time.sleep(0.01)
+
+    started = time.time()
+    while worker.backlog() and time.time() - started < 120:
+        time.sleep(0.1)
+    worker.stop()
+    server.shutdown()
+
+    cloud = sqlite3.connect(cloud_path)
+    total, distinct = cloud.execute("SELECT COUNT(*), COUNT(DISTINCT camera_id) FROM events").fetchone()
+
+    result = {
+        "events": args.events,
+        "server_rows": total,
+        "distinct": distinct,
+        "lost": args.events - distinct,
+        "duplicated": total - distinct,
+        "server": stats,
+        "drain_s": round(time.time() - started, 2),
+    }
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result["lost"] == 0 and result["duplicated"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
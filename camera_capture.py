@@ -0,0 +1,294 @@
+import os
+import time
+from collections import namedtuple
+
+import cv2
+
+import metrics
+
+# -------------------------------
+# CAMERA CAPTURE NEGOTIATION
+# -------------------------------
+#
+# cv2.VideoCapture(0) with driver defaults often ends up at full resolution
+# YUYV over USB at a reduced frame rate, only for YOLO to shrink every frame
+# to 640 anyway. open_camera() applies the requested width/height, fourcc,
+# FPS and buffer size, reads back what the driver actually accepted and
+# checks that frames arrive. In "auto" mode it tries formats from cheapest
+# to most expensive and keeps the first that covers the inference size at
+# the target frame rate: small resolutions first, and uncompressed YUYV
+# (no decode cost) before MJPG (JPEG decode on every frame, but much less
+# USB bandwidth).
+
+# CAMERA_MODE: "default" (driver defaults), "manual" (use the settings as
+# given) or "auto"
+CaptureSettings = namedtuple(
+    "CaptureSettings",
+    "source mode width height fps fourcc buffer_size imgsz",
+)
+
+# Network streams and files get a backend read timeout, so a stalled
+# stream fails the read instead of blocking the loop forever
+OPEN_TIMEOUT_MS = 10000
+READ_TIMEOUT_MS = 5000
+
+AUTO_RESOLUTIONS = [(640, 480), (800, 600), (960, 540), (1024, 576), (1280, 720), (1600, 900), (1920, 1080)]
+AUTO_FOURCCS = ["YUYV", "MJPG"]
+PROBE_FRAMES = 15
+
+
+def settings_from_env(prefix="CAMERA_"):
+    def get(name, default=None, cast=str):
+        value = os.environ.get(prefix + name)
+        return cast(value) if value not in (None, "") else default
+
+    source = get("SOURCE", "0")
+    return CaptureSettings(
+        source=int(source) if source.isdigit() else source,
+        mode=get("MODE", "default"),
+        width=get("WIDTH", None, int),
+        height=get("HEIGHT", None, int),
+        fps=get("FPS", None, float),
+        fourcc=get("FOURCC", None),
+        buffer_size=get("BUFFER_SIZE", None, int),
+        imgsz=get("IMGSZ", 640, int),
+    )
+
+
+def fourcc_name(value):
+    value = int(value)
+    if value <= 0:
+        return None
+    return "".join(chr((value >> (8 * i)) & 0xFF) for i in range(4)).strip("\x00") or None
+
+
+def negotiated(cap):
+    return {
+        "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        "fps": round(cap.get(cv2.CAP_PROP_FPS) or 0, 2),
+        "fourcc": fourcc_name(cap.get(cv2.CAP_PROP_FOURCC)),
+        "buffer_size": int(cap.get(cv2.CAP_PROP_BUFFERSIZE) or 0) or None,
+        "backend": cap.getBackendName(),
+    }
+
+
+def _apply(cap, width, height, fps, fourcc, buffer_size):
+    # FOURCC has to go first: most V4L2 drivers only offer the larger
+    # sizes and higher rates once the format is MJPG
+    if fourcc:
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+    if width and height:
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    if fps:
+        cap.set(cv2.CAP_PROP_FPS, fps)
+    if buffer_size:
+        # A short driver queue keeps detections on recent frames
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, buffer_size)
+
+
+def measure_fps(cap, frames=PROBE_FRAMES):
+    # Frame rate actually delivered; the first read is often slow while the
+    # stream starts, so it is not counted
+    ret, frame = cap.read()
+    if not ret:
+        return 0.0, None
+    started = time.perf_counter()
+    for _ in range(frames):
+        ret, frame = cap.read()
+        if not ret:
+            return 0.0, None
+    return frames / (time.perf_counter() - started), frame
+
+
+def _check(cap, requested):
+    # Drivers silently fall back to something else; compare what came back
+    info = negotiated(cap)
+    mismatches = []
+    if requested.get("fourcc") and info["fourcc"] != requested["fourcc"]:
+        mismatches.append(f"fourcc {info['fourcc']} != {requested['fourcc']}")
+    if requested.get("width") and (info["width"], info["height"]) != (requested["width"], requested["height"]):
+        mismatches.append(f"size {info['width']}x{info['height']} != {requested['width']}x{requested['height']}")
+    if requested.get("fps") and info["fps"] and info["fps"] + 0.5 < requested["fps"]:
+        mismatches.append(f"fps {info['fps']} < {requested['fps']}")
+    return info, mismatches
+
+
+def _auto_candidates(settings):
+    target_fps = settings.fps or 30
+    sizes = [(w, h) for w, h in AUTO_RESOLUTIONS if max(w, h) >= settings.imgsz] or AUTO_RESOLUTIONS[-1:]
+    fourccs = [settings.fourcc] if settings.fourcc else AUTO_FOURCCS
+    for width, height in sizes:
+        for fourcc in fourccs:
+            yield {"width": width, "height": height, "fps": target_fps, "fourcc": fourcc}
+
+
+def open_camera(settings):
+    # Returns (cap, info) where info describes what was negotiated.
+    params = []
+    if isinstance(settings.source, str) and hasattr(cv2, "CAP_PROP_READ_TIMEOUT_MSEC"):
+        params = [
+            cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, OPEN_TIMEOUT_MS,
+            cv2.CAP_PROP_READ_TIMEOUT_MSEC, READ_TIMEOUT_MS,
+        ]
+    cap = cv2.VideoCapture(settings.source, cv2.CAP_ANY, params) if params else cv2.VideoCapture(settings.source)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open camera {settings.source!r}")
+
+    requested = {}
+    if settings.mode == "manual":
+        requested = {
+            "width": settings.width, "height": settings.height,
+            "fps": settings.fps, "fourcc": settings.fourcc,
+        }
+        _apply(cap, settings.width, settings.height, settings.fps, settings.fourcc, settings.buffer_size)
+        _, mismatches = _check(cap, requested)
+        for problem in mismatches:
+            print(f"Camera {settings.source!r}: requested setting not applied: {problem}")
+
+    elif settings.mode == "auto":
+        chosen = None
+        for candidate in _auto_candidates(settings):
+            _apply(cap, candidate["width"], candidate["height"], candidate["fps"], candidate["fourcc"], settings.buffer_size)
+            _, mismatches = _check(cap, candidate)
+            if mismatches:
+                continue
+            measured, _ = measure_fps(cap)
+            # Some drivers report the requested rate but deliver less
+            if measured + 1.0 >= candidate["fps"] * 0.9:
+                chosen = candidate
+                break
+            print(f"Camera {settings.source!r}: {candidate['fourcc']} {candidate['width']}x{candidate['height']} only delivers {measured:.1f} fps")
+
+        if chosen is None:
+            # Nothing met the target; keep the last settings tried
+            print(f"Camera {settings.source!r}: no format reached {settings.fps or 30} fps at >= {settings.imgsz}px")
+        requested = chosen or {}
+
+    elif settings.buffer_size:
+        _apply(cap, None, None, None, None, settings.buffer_size)
+
+    measured, frame = measure_fps(cap)
+    if frame is None:
+        cap.release()
+        raise RuntimeError(f"Camera {settings.source!r} opened but returned no frames")
+
+    info = negotiated(cap)
+    info.update(
+        mode=settings.mode,
+        requested=requested or None,
+        measured_fps=round(measured, 1),
+        frame_shape=list(frame.shape),
+    )
+
+    metrics.set_gauge("capture.width", info["width"])
+    metrics.set_gauge("capture.height", info["height"])
+    metrics.set_gauge("capture.measured_fps", info["measured_fps"])
+    print(
+        f"Camera {settings.source!r}: {info['fourcc']} {info['width']}x{info['height']} "
+        f"@ {info['fps']} fps reported, {info['measured_fps']} measured ({info['backend']}, {settings.mode})"
+    )
+    return cap, info
+
+
+# -------------------------------
+# CAPTURE WATCHDOG
+# -------------------------------
+#
+# CaptureSupervisor.read() behaves like cap.read() but does not give up:
+# a failed read, a backend read timeout or a frozen picture (the same
+# frame for freeze_seconds) closes the source and reopens it with
+# exponential backoff. The loop just waits in read(), so the model,
+# tracker and frame buffer survive an outage. Recovery times are exported
+# as metrics.
+
+
+class CaptureSupervisor:
+    def __init__(self, settings, opener=open_camera, freeze_seconds=5.0,
+                 backoff=0.5, max_backoff=30.0):
+        self.settings = settings
+        self.opener = opener
+        self.freeze_seconds = freeze_seconds
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stopped = False
+        self.last_sig = None
+        self.frozen_since = None
+        self.cap, self.info = opener(settings)
+        metrics.set_gauge("capture.down", 0)
+
+    def read(self):
+        # (True, frame), or (False, None) only once stop() was called
+        while not self.stopped:
+            frame = self._read_once()
+            if frame is not None:
+                return True, frame
+            self._reconnect()
+        return False, None
+
+    def _read_once(self):
+        try:
+            ret, frame = self.cap.read()
+        except cv2.error as e:
+            print(f"Camera {self.settings.source!r} read error: {e}")
+            ret, frame = False, None
+
+        if not ret or frame is None:
+            metrics.inc("capture.read_failures")
+            print(f"Camera {self.settings.source!r} read failed")
+            return None
+
+        # A sparse grid of pixels is enough to tell a live picture (sensor
+        # noise) from a driver repeating its last buffer
+        now = time.time()
+        sig = frame[::16, ::16]
+        if self.last_sig is not None and sig.shape == self.last_sig.shape and (sig == self.last_sig).all():
+            if now - self.frozen_since >= self.freeze_seconds:
+                metrics.inc("capture.frozen")
+                print(f"Camera {self.settings.source!r} frozen for {now - self.frozen_since:.1f}s")
+                return None
+        else:
+            self.last_sig = sig.copy()
+            self.frozen_since = now
+        return frame
+
+    def _reconnect(self):
+        down_at = time.time()
+        metrics.set_gauge("capture.down", 1)
+        self.release()
+
+        delay = self.backoff
+        attempt = 0
+        while not self.stopped:
+            attempt += 1
+            try:
+                self.cap, self.info = self.opener(self.settings)
+                break
+            except Exception as e:
+                print(f"Camera {self.settings.source!r} reopen attempt {attempt} failed: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+
+        if self.cap is None:
+            return
+
+        recovery = time.time() - down_at
+        self.last_sig = None
+        metrics.inc("capture.reconnects")
+        metrics.set_gauge("capture.down", 0)
+        metrics.set_gauge("capture.last_recovery_s", round(recovery, 2))
+        metrics.inc("capture.downtime_s", round(recovery, 2))
+        print(f"Camera {self.settings.source!r} reconnected after {recovery:.1f}s ({attempt} attempts)")
+
+    def release(self):
+        if self.cap is not None:
+            try:
+                self.cap.release()
+            except Exception:
+                pass
+            self.cap = None
+
+    def stop(self):
+        self.stopped = True
+        self.release()
@@ -0,0 +1,166 @@
+import json
+import time
+from datetime import datetime, timezone
+
+import events_db
+
+# -------------------------------
+# PER-CAMERA LATEST STATUS
+# -------------------------------
+#
+# One row per camera_id, kept current by an insert trigger on events: the
+# last event (by event timestamp, so a late sync of an older event does not
+# roll it back), when the server last heard of the camera, and counts for
+# the event's day, reset when the first event of a new day arrives. Edge
+# nodes also post a heartbeat with their tracker state, sync backlog and
+# UTC offset; event days are edge-local, so "today" is taken in the
+# camera's own timezone.
+# /cameras reads this table only, so it costs O(cameras), not O(events).
+# Like the rollups, an upsert of an existing event_uid does not count twice.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS camera_status (
+ camera_id TEXT PRIMARY KEY,
+ last_event_id INTEGER,
+ last_event_uid TEXT,
+ last_status TEXT,
+ last_event_at TEXT,
+ last_seen REAL,
+ day TEXT,
+ day_total INTEGER DEFAULT 0,
+ day_unauthorized INTEGER DEFAULT 0,
+ node_id TEXT,
+ heartbeat_at REAL,
+ node_backlog INTEGER,
+ state TEXT,
+ utc_offset INTEGER
+)
+"""
+
+NOW_EPOCH = "((julianday('now') - 2440587.5) * 86400.0)"
+
+TRIGGER = f"""
+CREATE TRIGGER IF NOT EXISTS camera_status_insert AFTER INSERT ON events
+WHEN NEW.camera_id IS NOT NULL
+BEGIN
+ INSERT INTO camera_status (camera_id, last_event_id, last_event_uid, last_status, last_event_at,
+                            last_seen, day, day_total, day_unauthorized)
+ VALUES (NEW.camera_id, NEW.id, NEW.event_uid, NEW.status, NEW.timestamp,
+         {NOW_EPOCH}, substr(NEW.timestamp, 1, 10), 1, NEW.status = 'UNAUTHORIZED')
+ ON CONFLICT(camera_id) DO UPDATE SET
+  last_event_id = CASE WHEN excluded.last_event_at >= COALESCE(last_event_at, '') THEN excluded.last_event_id ELSE last_event_id END,
+  last_event_uid = CASE WHEN excluded.last_event_at >= COALESCE(last_event_at, '') THEN excluded.last_event_uid ELSE last_event_uid END,
+  last_status = CASE WHEN excluded.last_event_at >= COALESCE(last_event_at, '') THEN excluded.last_status ELSE last_status END,
+  last_event_at = MAX(COALESCE(last_event_at, ''), excluded.last_event_at),
+  last_seen = excluded.last_seen,
+  day_total = CASE
+   WHEN excluded.day > COALESCE(day, '') THEN 1
+   WHEN excluded.day = day THEN day_total + 1
+   ELSE day_total END,
+  day_unauthorized = CASE
+   WHEN excluded.day > COALESCE(day, '') THEN excluded.day_unauthorized
+   WHEN excluded.day = day THEN day_unauthorized + excluded.day_unauthorized
+   ELSE day_unauthorized END,
+  day = MAX(COALESCE(day, ''), excluded.day);
+END
+"""
+
+# A camera whose node has not sent a heartbeat for this long is offline
+STALE_AFTER = 90
+
+
+def init(conn):
+    with events_db.migration(conn):
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'camera_status'"
+        ).fetchone()
+
+        conn.execute(SCHEMA)
+        conn.execute(TRIGGER)
+
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(camera_status)")}
+        if "utc_offset" not in columns:
+            conn.execute("ALTER TABLE camera_status ADD COLUMN utc_offset INTEGER")
+
+        if not exists:
+            # First run on an existing database: latest event per camera from
+            # the hot table, day counts from the daily rollup
+            conn.execute("""
+            INSERT INTO camera_status (camera_id, last_event_id, last_event_uid, last_status, last_event_at, day)
+            SELECT camera_id, id, event_uid, status, MAX(timestamp), substr(MAX(timestamp), 1, 10)
+            FROM events WHERE camera_id IS NOT NULL GROUP BY camera_id
+            """)
+            conn.execute("""
+            UPDATE camera_status SET
+             day_total = COALESCE((SELECT SUM(count) FROM rollup_daily r
+                                   WHERE r.camera_id = camera_status.camera_id AND r.day = camera_status.day), 0),
+             day_unauthorized = COALESCE((SELECT SUM(count) FROM rollup_daily r
+                                          WHERE r.camera_id = camera_status.camera_id AND r.day = camera_status.day
+                                          AND r.status = 'UNAUTHORIZED'), 0)
+            """)
+
+
+def heartbeat(conn, node_id, cameras, backlog=None, utc_offset=None):
+    # cameras: {camera_id: state dict} as reported by the edge node;
+    # utc_offset: the node's local time minus UTC, in seconds
+    now = time.time()
+    with conn:
+        conn.executemany("""
+        INSERT INTO camera_status (camera_id, node_id, heartbeat_at, node_backlog, state, last_seen, utc_offset)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(camera_id) DO UPDATE SET
+         node_id = excluded.node_id,
+         heartbeat_at = excluded.heartbeat_at,
+         node_backlog = excluded.node_backlog,
+         state = excluded.state,
+         last_seen = MAX(COALESCE(last_seen, 0), excluded.last_seen),
+         utc_offset = COALESCE(excluded.utc_offset, utc_offset)
+        """, [
+            (camera_id, node_id, now, backlog, json.dumps(state), now, utc_offset)
+            for camera_id, state in cameras.items()
+        ])
+    return len(cameras)
+
+
+def list_cameras(conn, stale_after=STALE_AFTER, now=None):
+    now = now or time.time()
+    # Cameras that never reported an offset run on this host's clock
+    local_today = datetime.fromtimestamp(now).strftime("%Y-%m-%d")
+    cameras = []
+
+    for (camera_id, last_event_id, last_event_uid, last_status, last_event_at, last_seen,
+         day, day_total, day_unauthorized, node_id, heartbeat_at, node_backlog, state,
+         utc_offset) in conn.execute(
+            """
+            SELECT camera_id, last_event_id, last_event_uid, last_status, last_event_at, last_seen,
+                   day, day_total, day_unauthorized, node_id, heartbeat_at, node_backlog, state,
+                   utc_offset
+            FROM camera_status ORDER BY camera_id
+            """):
+        if utc_offset is None:
+            today = local_today
+        else:
+            today = datetime.fromtimestamp(now + utc_offset, timezone.utc).strftime("%Y-%m-%d")
+        # Counts belong to the day of the camera's latest event; none yet today
+        is_today = day == today
+        cameras.append({
+            "camera_id": camera_id,
+            "last_event": last_event_id and {
+                "id": last_event_id,
+                "event_uid": last_event_uid,
+                "status": last_status,
+                "timestamp": last_event_at,
+            },
+            "last_seen": last_seen,
+            "today": {
+                "total": day_total if is_today else 0,
+                "unauthorized": day_unauthorized if is_today else 0,
+            },
+            "node_id": node_id,
+            "heartbeat_at": heartbeat_at,
+            "online": bool(heartbeat_at and now - heartbeat_at < stale_after),
+            "node_backlog": node_backlog,
+            "state": json.loads(state) if state else None,
+        })
+
+    return cameras
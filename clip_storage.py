@@ -0,0 +1,166 @@
+import json
+import os
+import threading
+import time
+
+import events_db
+import metrics
+
+# -------------------------------
+# LOCAL CLIP STORAGE MANAGER
+# -------------------------------
+#
+# Every clip written to clips/ (with its poster, strip, index and upload
+# copy) is recorded in the clip_files table with its size. enforce() keeps
+# the directory under a byte quota and an age limit: clips past the age
+# limit are always removed, and to get under the byte quota clips that have
+# already been uploaded go first, least recently used first, before any
+# clip that only exists locally.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS clip_files (
+ path TEXT PRIMARY KEY,
+ extra_paths TEXT,
+ bytes INTEGER,
+ created_at REAL,
+ last_access REAL,
+ uploaded INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_clip_files_evict
+ ON clip_files (uploaded, last_access);
+"""
+
+CLIP_EXTENSIONS = (".mp4",)
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class ClipStorage:
+    def __init__(self, db_path, clips_dir="clips", max_bytes=None, max_age=None):
+        self.clips_dir = clips_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.db = events_db.connect(db_path)
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+        os.makedirs(clips_dir, exist_ok=True)
+
+    def register(self, path, extra_paths=(), uploaded=False):
+        extra = [p for p in extra_paths if p and p != path]
+        total = _size(path) + sum(_size(p) for p in extra)
+        now = time.time()
+
+        with self.lock:
+            self.db.execute("""
+            INSERT INTO clip_files (path, extra_paths, bytes, created_at, last_access, uploaded)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(path) DO UPDATE SET
+             extra_paths = excluded.extra_paths,
+             bytes = excluded.bytes,
+             uploaded = MAX(uploaded, excluded.uploaded)
+            """, (path, json.dumps(extra), total, now, now, int(uploaded)))
+            self.db.commit()
+
+        self._update_gauges()
+
+    def mark_uploaded(self, path):
+        with self.lock:
+            self.db.execute("UPDATE clip_files SET uploaded = 1 WHERE path = ?", (path,))
+            self.db.commit()
+
+    def touch(self, path):
+        with self.lock:
+            self.db.execute("UPDATE clip_files SET last_access = ? WHERE path = ?", (time.time(), path))
+            self.db.commit()
+
+    def sync_dir(self):
+        # Picks up clips written before the storage manager existed.
+        with self.lock:
+            known = {row[0] for row in self.db.execute("SELECT path FROM clip_files")}
+
+        for name in sorted(os.listdir(self.clips_dir)):
+            path = os.path.join(self.clips_dir, name)
+            if not name.endswith(CLIP_EXTENSIONS) or name.endswith("_upload.mp4") or path in known:
+                continue
+
+            root = path.rsplit(".", 1)[0]
+            extra = [root + suffix for suffix in ("_upload.mp4", ".jpg", "_strip.jpg", ".json")]
+            extra = [p for p in extra if os.path.exists(p)]
+            total = _size(path) + sum(_size(p) for p in extra)
+            mtime = os.path.getmtime(path)
+
+            with self.lock:
+                self.db.execute("""
+                INSERT OR IGNORE INTO clip_files (path, extra_paths, bytes, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?)
+                """, (path, json.dumps(extra), total, mtime, mtime))
+                self.db.commit()
+
+        self._update_gauges()
+
+    def usage(self):
+        with self.lock:
+            count, total = self.db.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM clip_files").fetchone()
+        return {"clips": count, "bytes": total, "max_bytes": self.max_bytes, "max_age": self.max_age}
+
+    def enforce(self, reserve=0):
+        # Evicts until usage + reserve fits the quota; returns evicted paths.
+        evicted = []
+
+        with self.lock:
+            if self.max_age:
+                rows = self.db.execute(
+                    "SELECT path, extra_paths, bytes FROM clip_files WHERE created_at < ?",
+                    (time.time() - self.max_age,)
+                ).fetchall()
+                for row in rows:
+                    self._evict(row, "age")
+                    evicted.append(row[0])
+
+            if self.max_bytes:
+                total = self.db.execute("SELECT COALESCE(SUM(bytes), 0) FROM clip_files").fetchone()[0]
+                if total + reserve > self.max_bytes:
+                    rows = self.db.execute("""
+                    SELECT path, extra_paths, bytes FROM clip_files
+                    ORDER BY uploaded DESC, last_access ASC
+                    """)
+                    for row in rows.fetchall():
+                        if total + reserve <= self.max_bytes:
+                            break
+                        self._evict(row, "quota")
+                        evicted.append(row[0])
+                        total -= row[2]
+
+            self.db.commit()
+
+        self._update_gauges()
+        return evicted
+
+    def _evict(self, row, reason):
+        path, extra, size = row
+        for p in [path] + json.loads(extra or "[]"):
+            # .upload.json is the resumable-upload progress file, if any
+            for f in (p, p + ".upload.json"):
+                try:
+                    os.remove(f)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print("Evict error:", e)
+        self.db.execute("DELETE FROM clip_files WHERE path = ?", (path,))
+        metrics.inc("clip_storage.evictions")
+        metrics.inc(f"clip_storage.evictions.{reason}")
+        metrics.inc("clip_storage.evicted_bytes", size)
+
+    def _update_gauges(self):
+        usage = self.usage()
+        metrics.set_gauge("clip_storage.clips", usage["clips"])
+        metrics.set_gauge("clip_storage.bytes", usage["bytes"])
+        if self.max_bytes:
+            metrics.set_gauge("clip_storage.quota_used", round(usage["bytes"] / self.max_bytes, 4))
@@ -0,0 +1,351 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import events_db
+import metrics
+
+# -------------------------------
+# CHUNKED, RESUMABLE CLIP UPLOAD
+# -------------------------------
+#
+# Clips are sent in fixed-size chunks. Each chunk is retried with backoff on
+# its own, and progress is kept in a small <clip>.upload.json file so a
+# failed upload resumes from the last acknowledged chunk instead of from
+# byte zero. A shared throttle caps upload bandwidth so the uplink still has
+# room for the camera stream; with a cap, chunks are cut to about one second
+# of it so no chunk goes out as a long line-rate burst.
+#
+# Storage backends implement begin / offset / put_chunk / complete, and may
+# set min_chunk:
+#   LocalBackend      - a directory (or mounted bucket) for testing
+#   CloudinaryBackend - Cloudinary's chunked upload protocol
+#
+# UploadQueue keeps files waiting for upload in events.db and retries the
+# ones that fail, also after a restart.
+
+DEFAULT_CHUNK_BYTES = 5 * 1024 * 1024
+
+
+class UploadError(Exception):
+    pass
+
+
+class Throttle:
+    # Token bucket shared by all uploads in the process.
+    def __init__(self, bytes_per_sec):
+        self.rate = bytes_per_sec
+        self.allowance = bytes_per_sec or 0
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, n):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.allowance = min(self.rate, self.allowance + (now - self.last) * self.rate)
+            self.last = now
+            self.allowance -= n
+            wait = -self.allowance / self.rate if self.allowance < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class LocalBackend:
+    min_chunk = 1
+
+    def __init__(self, root, base_url=None):
+        self.root = root
+        self.base_url = base_url
+        os.makedirs(os.path.join(root, ".partial"), exist_ok=True)
+
+    def begin(self, key, size):
+        return {"upload_id": uuid.uuid4().hex, "key": key, "size": size}
+
+    def _partial(self, session):
+        return os.path.join(self.root, ".partial", session["upload_id"])
+
+    def offset(self, session, local_offset):
+        # The stored partial is authoritative; a chunk written but not
+        # acknowledged locally is simply not re-sent.
+        try:
+            return os.path.getsize(self._partial(session))
+        except OSError:
+            return 0
+
+    def put_chunk(self, session, offset, data):
+        with open(self._partial(session), "ab") as f:
+            if f.tell() != offset:
+                f.truncate(offset)
+                f.seek(offset)
+            f.write(data)
+        return None
+
+    def complete(self, session, last_result):
+        dest = os.path.join(self.root, session["key"])
+        os.makedirs(os.path.dirname(dest) or self.root, exist_ok=True)
+        shutil.move(self._partial(session), dest)
+        if self.base_url:
+            return self.base_url.rstrip("/") + "/" + session["key"]
+        return "file://" + os.path.abspath(dest)
+
+
+class CloudinaryBackend:
+    # Cloudinary rejects parts under 5 MB other than the last
+    min_chunk = 5 * 1024 * 1024
+
+    def __init__(self, resource_type="video"):
+        self.resource_type = resource_type
+
+    def begin(self, key, size):
+        return {"upload_id": uuid.uuid4().hex, "key": key, "size": size}
+
+    def offset(self, session, local_offset):
+        # Cloudinary keeps parts under X-Unique-Upload-Id but has no offset
+        # query, so resume from the last chunk acknowledged locally.
+        return local_offset
+
+    def put_chunk(self, session, offset, data):
+        import cloudinary.uploader
+
+        end = offset + len(data) - 1
+        return cloudinary.uploader.upload_large_part(
+            (session["key"], data),
+            http_headers={
+                "Content-Range": f"bytes {offset}-{end}/{session['size']}",
+                "X-Unique-Upload-Id": session["upload_id"],
+            },
+            resource_type=self.resource_type
+        )
+
+    def complete(self, session, last_result):
+        if not last_result or "secure_url" not in last_result:
+            raise UploadError("Cloudinary did not return a URL for the final chunk")
+        return last_result["secure_url"]
+
+
+class ChunkedUploader:
+    def __init__(self, backend, chunk_size=DEFAULT_CHUNK_BYTES, max_retries=5,
+                 backoff=1.0, bytes_per_sec=None, throttle=None):
+        self.backend = backend
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        # Pass one Throttle to several uploaders to cap their combined rate
+        self.throttle = throttle or Throttle(bytes_per_sec)
+
+    def _state_path(self, path):
+        return path + ".upload.json"
+
+    def _chunk_bytes(self):
+        # About one second of the bandwidth cap, but never below what the
+        # backend accepts
+        if not self.throttle.rate:
+            return self.chunk_size
+        return max(min(self.chunk_size, self.throttle.rate), getattr(self.backend, "min_chunk", 1))
+
+    def _load_state(self, path, size, mtime):
+        try:
+            with open(self._state_path(path)) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # A rewritten file (e.g. faststart) invalidates the partial upload.
+        if state.get("size") != size or state.get("mtime") != mtime:
+            return None
+        return state
+
+    def _save_state(self, path, state):
+        tmp = self._state_path(path) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, self._state_path(path))
+
+    def upload(self, path, key=None):
+        key = key or os.path.basename(path)
+        size = os.path.getsize(path)
+        mtime = os.path.getmtime(path)
+
+        state = self._load_state(path, size, mtime)
+        if state is None:
+            state = {"session": self.backend.begin(key, size), "offset": 0, "size": size, "mtime": mtime}
+            self._save_state(path, state)
+        else:
+            metrics.inc("upload.resumed")
+
+        chunk_size = self._chunk_bytes()
+        offset = self.backend.offset(state["session"], state["offset"])
+        if offset >= size:
+            # Everything was sent but completion was lost; resend the last
+            # chunk so the backend answers with the final result again.
+            offset = max(0, (size - 1) // chunk_size * chunk_size)
+
+        result = None
+        started = time.perf_counter()
+        sent = 0
+
+        with open(path, "rb") as f:
+            while True:
+                f.seek(offset)
+                data = f.read(chunk_size)
+                self.throttle.consume(len(data))
+                result = self._put_with_retry(state["session"], offset, data)
+                offset += len(data)
+                sent += len(data)
+                state["offset"] = offset
+                self._save_state(path, state)
+                if offset >= size:
+                    break
+
+        url = self.backend.complete(state["session"], result)
+        os.remove(self._state_path(path))
+
+        elapsed = time.perf_counter() - started
+        metrics.inc("upload.completed")
+        metrics.inc("upload.bytes", sent)
+        if elapsed > 0:
+            metrics.set_gauge("upload.last_bytes_per_sec", round(sent / elapsed))
+        return url
+
+    def _put_with_retry(self, session, offset, data):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.backend.put_chunk(session, offset, data)
+            except Exception as e:
+                metrics.inc("upload.chunk_retries")
+                if attempt == self.max_retries:
+                    metrics.inc("upload.failed")
+                    raise UploadError(f"chunk at {offset} failed after {attempt + 1} attempts: {e}") from e
+                delay = self.backoff * 2 ** attempt
+                print(f"Upload chunk at {offset} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+
+# -------------------------------
+# UPLOAD RETRY QUEUE
+# -------------------------------
+#
+# One row per (file, event, link field). A background thread uploads the
+# file that is due next; a failure (the uplink down for longer than a
+# chunk's retries) puts the file back with an exponential delay, and the
+# next attempt resumes from its .upload.json progress. Rows live in
+# events.db, so uploads left over from before a restart are picked up
+# again. Once a file is up, on_uploaded(path, url, owner, links) gets the
+# [(event_uid, field), ...] waiting for it; a file that was evicted before
+# it could be sent is dropped.
+
+QUEUE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS upload_queue (
+ path TEXT,
+ resource_type TEXT,
+ event_uid TEXT,
+ field TEXT,
+ owner TEXT,
+ attempts INTEGER DEFAULT 0,
+ next_attempt REAL DEFAULT 0,
+ PRIMARY KEY (path, event_uid, field)
+);
+CREATE INDEX IF NOT EXISTS idx_upload_queue_due ON upload_queue (next_attempt);
+"""
+
+
+class UploadQueue:
+    def __init__(self, db_path, uploaders, on_uploaded, retry_interval=30.0,
+                 max_backoff=3600.0, poll_interval=5.0):
+        # uploaders: {resource_type: ChunkedUploader}
+        self.uploaders = uploaders
+        self.on_uploaded = on_uploaded
+        self.retry_interval = retry_interval
+        self.max_backoff = max_backoff
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.db = events_db.connect(db_path)
+        self.db.executescript(QUEUE_SCHEMA)
+        self.db.commit()
+        self.wake = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def add(self, items):
+        # items: (path, resource_type, event_uid, field, owner); owner is
+        # the clip the file belongs to
+        with self.lock:
+            self.db.executemany("""
+            INSERT OR IGNORE INTO upload_queue (path, resource_type, event_uid, field, owner)
+            VALUES (?, ?, ?, ?, ?)
+            """, items)
+            self.db.commit()
+        self.wake.set()
+
+    def pending(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(DISTINCT path) FROM upload_queue").fetchone()[0]
+
+    def run_once(self):
+        # Tries the next file that is due; returns False if none is
+        with self.lock:
+            row = self.db.execute("""
+            SELECT path, resource_type, owner, attempts FROM upload_queue
+            WHERE next_attempt <= ? ORDER BY next_attempt LIMIT 1
+            """, (time.time(),)).fetchone()
+        if row is None:
+            return False
+
+        path, resource_type, owner, attempts = row
+        if not os.path.exists(path):
+            self._drop(path)
+            metrics.inc("upload.dropped")
+            return True
+
+        try:
+            url = self.uploaders[resource_type].upload(path)
+        except Exception as e:
+            delay = min(self.max_backoff, self.retry_interval * 2 ** attempts)
+            print(f"Upload of {path} failed ({e}), retrying in {delay:.0f}s")
+            metrics.inc("upload.requeued")
+            with self.lock:
+                self.db.execute(
+                    "UPDATE upload_queue SET attempts = attempts + 1, next_attempt = ? WHERE path = ?",
+                    (time.time() + delay, path)
+                )
+                self.db.commit()
+            return True
+
+        with self.lock:
+            links = self.db.execute(
+                "SELECT event_uid, field FROM upload_queue WHERE path = ?", (path,)
+            ).fetchall()
+        self.on_uploaded(path, url, owner, links)
+        self._drop(path)
+        return True
+
+    def _drop(self, path):
+        with self.lock:
+            self.db.execute("DELETE FROM upload_queue WHERE path = ?", (path,))
+            self.db.commit()
+
+    def _loop(self):
+        while not self.stop_event.is_set():
+            try:
+                busy = self.run_once()
+            except Exception as e:
+                print("Upload queue error:", e)
+                busy = False
+            metrics.set_gauge("upload.pending", self.pending())
+            if not busy:
+                self.wake.wait(self.poll_interval)
+                self.wake.clear()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join()
@@ -0,0 +1,462 @@
+import functools
+import json
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+from collections import deque, namedtuple
+
+import cv2
+
+import mp4_faststart
+
+# -------------------------------
+# VIOLATION CLIP WRITER
+# -------------------------------
+#
+# The ring buffer keeps each frame together with the detections the tracker
+# produced for it, so a clip can be cut around the moment the secondary
+# person showed up instead of dumping the whole 10 s buffer.
+
+BufferedFrame = namedtuple("BufferedFrame", ["t", "frame", "ids", "boxes"])
+
+
+class FrameBuffer(deque):
+    # Keeps the last `seconds` of frames by capture timestamp rather than a
+    # fixed count, so the span stays right when the camera misreports its
+    # FPS or the loop slows down. max_frames is only a memory backstop.
+    def __init__(self, seconds, max_frames=None):
+        super().__init__()
+        self.seconds = seconds
+        self.max_frames = max_frames
+
+    def append(self, entry):
+        super().append(entry)
+        while len(self) > 1 and entry.t - self[0].t > self.seconds:
+            self.popleft()
+        if self.max_frames and len(self) > self.max_frames:
+            self.popleft()
+
+    def measured_fps(self, since=None):
+        if since is None:
+            return measured_fps(self)
+        return measured_fps([f for f in self if f.t >= since])
+
+
+def measured_fps(frames):
+    # Real frame rate from capture timestamps; None with too few frames
+    if len(frames) < 2:
+        return None
+    span = frames[-1].t - frames[0].t
+    if span <= 0:
+        return None
+    return (len(frames) - 1) / span
+
+
+def select_frames(buffer, start_t, end_t):
+    return [f for f in buffer if start_t <= f.t <= end_t]
+
+
+def first_seen(buffer, track_ids, since=None):
+    # Earliest buffered timestamp at which any of track_ids was detected.
+    track_ids = set(track_ids)
+    for f in buffer:
+        if since is not None and f.t < since:
+            continue
+        if track_ids.intersection(f.ids):
+            return f.t
+    return None
+
+
+def trim_window(buffer, event_start, window_end, pre_roll, post_roll):
+    if event_start is None:
+        event_start = buffer[0].t if buffer else window_end
+    return event_start - pre_roll, window_end + post_roll
+
+
+# -------------------------------
+# ENCODER BACKENDS
+# -------------------------------
+#
+# "ffmpeg" pipes raw BGR frames into an ffmpeg subprocess and produces H.264
+# that browsers can play; "opencv" is the old mp4v VideoWriter. "auto" uses
+# ffmpeg when it is installed and falls back to VideoWriter otherwise.
+
+# Preferred H.264 encoders, hardware first, with their rate-control flags
+FFMPEG_CODECS = [
+    ("h264_nvenc", ["-preset", "p2", "-cq", "26"]),
+    ("h264_videotoolbox", ["-b:v", "2M"]),
+    ("h264_qsv", ["-preset", "veryfast", "-global_quality", "26"]),
+    ("libx264", ["-preset", "veryfast", "-crf", "26"]),
+    ("libopenh264", ["-b:v", "2M"]),
+]
+
+
+@functools.lru_cache(maxsize=None)
+def ffmpeg_codec():
+    # (ffmpeg_binary, codec, codec_args) for the best available encoder, or None
+    binary = shutil.which("ffmpeg")
+    if binary is None:
+        return None
+
+    try:
+        listing = subprocess.run(
+            [binary, "-hide_banner", "-encoders"],
+            capture_output=True, text=True, timeout=10
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+    available = {line.split()[1] for line in listing.splitlines() if len(line.split()) > 1}
+    for codec, args in FFMPEG_CODECS:
+        if codec in available and _codec_works(binary, codec, args):
+            return binary, codec, args
+    return None
+
+
+def _codec_works(binary, codec, args):
+    # Hardware encoders are often listed but unusable (no GPU / driver).
+    probe = [
+        binary, "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", "color=black:s=64x64:d=0.1",
+        "-c:v", codec, *args, "-f", "null", "-",
+    ]
+    try:
+        return subprocess.run(probe, capture_output=True, timeout=20).returncode == 0
+    except (OSError, subprocess.SubprocessError):
+        return False
+
+
+class FfmpegWriter:
+    def __init__(self, path, fps, size, binary, codec, codec_args):
+        w, h = size
+        self.codec = codec
+        self.proc = subprocess.Popen(
+            [
+                binary, "-y", "-hide_banner", "-loglevel", "error",
+                "-f", "rawvideo", "-pix_fmt", "bgr24",
+                "-s", f"{w}x{h}", "-r", f"{fps:.3f}",
+                "-i", "-",
+                "-an", "-c:v", codec, *codec_args,
+                "-pix_fmt", "yuv420p",
+                "-movflags", "+faststart",
+                path,
+            ],
+            stdin=subprocess.PIPE
+        )
+
+    def write(self, frame):
+        self.proc.stdin.write(frame.tobytes())
+
+    def release(self):
+        self.proc.stdin.close()
+        if self.proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg ({self.codec}) exited with {self.proc.returncode}")
+
+
+class OpenCVWriter:
+    codec = "mp4v"
+
+    def __init__(self, path, fps, size):
+        self.path = path
+        self.out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+
+    def write(self, frame):
+        self.out.write(frame)
+
+    def release(self):
+        self.out.release()
+        # VideoWriter leaves moov at the end; move it up so playback can
+        # start before the whole file is downloaded
+        mp4_faststart.make_faststart(self.path)
+
+
+def open_writer(path, fps, size, backend="auto"):
+    if backend in ("auto", "ffmpeg"):
+        found = ffmpeg_codec()
+        if found is not None:
+            return FfmpegWriter(path, fps, size, *found)
+        if backend == "ffmpeg":
+            print("ffmpeg not available, falling back to VideoWriter")
+    return OpenCVWriter(path, fps, size)
+
+
+def scaled_size(w, h, scale):
+    if scale == 1.0:
+        return w, h
+    return max(2, int(w * scale) // 2 * 2), max(2, int(h * scale) // 2 * 2)
+
+
+def upload_step(fps, upload_fps):
+    if not upload_fps or upload_fps >= fps:
+        return 1
+    return max(1, int(round(fps / upload_fps)))
+
+
+# -------------------------------
+# TRIAGE ARTIFACTS
+# -------------------------------
+#
+# Written next to each clip so the dashboard can triage a violation without
+# fetching the video: a poster frame (the frame with the most people in it),
+# a horizontal strip of small thumbnails and a JSON index of the per-frame
+# detections already kept in the ring buffer.
+
+THUMB_WIDTH = 160
+STRIP_FRAMES = 8
+STRIP_INTERVAL = 0.5
+
+
+class ClipArtifacts:
+    def __init__(self):
+        self.frames = []
+        self.thumbs = []
+        self.poster = None
+        self.poster_people = -1
+        self.t0 = None
+        self.next_thumb_t = None
+
+    def add(self, entry):
+        if self.t0 is None:
+            self.t0 = entry.t
+            self.next_thumb_t = entry.t
+
+        self.frames.append({
+            "t": round(entry.t - self.t0, 3),
+            "ids": [int(i) for i in entry.ids],
+            "boxes": [[int(v) for v in box] for box in entry.boxes],
+        })
+
+        if len(entry.ids) > self.poster_people:
+            ok, jpg = cv2.imencode(".jpg", entry.frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
+            if ok:
+                self.poster = jpg
+                self.poster_people = len(entry.ids)
+
+        if entry.t >= self.next_thumb_t:
+            h, w = entry.frame.shape[:2]
+            size = (THUMB_WIDTH, max(2, int(h * THUMB_WIDTH / w)))
+            self.thumbs.append((entry.t - self.t0, cv2.resize(entry.frame, size, interpolation=cv2.INTER_AREA)))
+            self.next_thumb_t = entry.t + STRIP_INTERVAL
+
+    def save(self, clip_path, fps):
+        # Returns {"poster_path", "strip_path", "index_path"} (None when missing)
+        root = clip_path.rsplit(".", 1)[0]
+        paths = {"poster_path": None, "strip_path": None, "index_path": root + ".json"}
+
+        if self.poster is not None:
+            paths["poster_path"] = root + ".jpg"
+            with open(paths["poster_path"], "wb") as f:
+                f.write(self.poster.tobytes())
+
+        strip_times = []
+        if self.thumbs:
+            step = max(1, len(self.thumbs) // STRIP_FRAMES)
+            picked = self.thumbs[::step][:STRIP_FRAMES]
+            strip_times = [round(t, 3) for t, _ in picked]
+            paths["strip_path"] = root + "_strip.jpg"
+            cv2.imwrite(paths["strip_path"], cv2.hconcat([img for _, img in picked]), [cv2.IMWRITE_JPEG_QUALITY, 70])
+
+        with open(paths["index_path"], "w") as f:
+            json.dump({
+                "clip": os.path.basename(clip_path),
+                "fps": fps,
+                "poster": paths["poster_path"] and os.path.basename(paths["poster_path"]),
+                "strip": paths["strip_path"] and os.path.basename(paths["strip_path"]),
+                "strip_times": strip_times,
+                "frames": self.frames,
+            }, f, separators=(",", ":"))
+
+        return paths
+
+
+# -------------------------------
+# POST-ROLL RECORDER
+# -------------------------------
+#
+# A verdict opens an encoder, writes the trimmed pre-event frames, and then
+# keeps streaming live frames until the post-roll runs out, so the clip shows
+# the tailgater actually going through the door. Encoding happens on a
+# background thread; the detection loop only pushes frame references onto a
+# queue. A violation that lands while a clip is still recording extends that
+# clip instead of starting a second one over the same frames. Finished clips
+# are handed to on_complete on a thread of their own, so a slow upload never
+# holds up encoding of the next clip.
+
+
+class ClipJob:
+    def __init__(self, path, upload_path, until, events, fps):
+        self.path = path
+        self.upload_path = upload_path
+        self.until = until
+        self.events = events
+        self.fps = fps
+        self.frames_written = 0
+        self.encoder = None
+        self.encode_seconds = 0.0
+        self.bytes = 0
+        self.artifacts = ClipArtifacts()
+        self.artifact_paths = {}
+
+    @property
+    def encode_fps(self):
+        if not self.encode_seconds:
+            return None
+        return self.frames_written / self.encode_seconds
+
+
+class ClipRecorder:
+    def __init__(self, fps, on_complete, upload_fps=None, upload_scale=1.0, encoder="auto"):
+        self.fps = fps
+        self.encoder = encoder
+        self.on_complete = on_complete
+        self.upload_fps = upload_fps
+        self.upload_scale = upload_scale
+        self.job = None
+        self.last_t = None
+        self.queue = queue.Queue()
+        self.done = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        self.done_thread = threading.Thread(target=self._complete, daemon=True)
+        self.done_thread.start()
+
+    @property
+    def recording(self):
+        return self.job is not None
+
+    def start(self, path, buffer, event_start, window_end, event,
+              pre_roll=2.0, post_roll=3.0):
+        until = window_end + post_roll
+
+        if self.job is not None:
+            # Overlapping violation: merge into the clip already recording.
+            self.job.until = max(self.job.until, until)
+            self.job.events.append(event)
+            return self.job
+
+        start_t, _ = trim_window(buffer, event_start, window_end, pre_roll, post_roll)
+        frames = select_frames(buffer, start_t, window_end) or list(buffer)
+
+        # Encode at the rate the frames were actually captured, so the clip
+        # plays back in real time; self.fps is only the fallback
+        fps = measured_fps(buffer) or self.fps
+
+        upload_path = path
+        if upload_step(fps, self.upload_fps) != 1 or self.upload_scale != 1.0:
+            root, ext = path.rsplit(".", 1)
+            upload_path = f"{root}_upload.{ext}"
+
+        job = ClipJob(path, upload_path, until, [event], fps)
+        self.job = job
+        self.queue.put(("open", job))
+        for f in frames:
+            self.queue.put(("frame", f))
+        self.last_t = frames[-1].t if frames else window_end
+        return job
+
+    def feed(self, entry):
+        # Called with every buffered frame; cheap when nothing is recording.
+        job = self.job
+        if job is None:
+            return
+
+        if entry.t > job.until:
+            self._close()
+            return
+
+        if entry.t > self.last_t:
+            self.queue.put(("frame", entry))
+            self.last_t = entry.t
+
+    def flush(self):
+        if self.job is not None:
+            self._close()
+        self.queue.join()
+        self.done.join()
+
+    def _close(self):
+        self.queue.put(("close", self.job))
+        self.job = None
+
+    def _run(self):
+        job = None
+        writer = None
+        upload_writer = None
+        step = 1
+        size = None
+        upload_size = None
+
+        while True:
+            kind, item = self.queue.get()
+            try:
+                if kind == "open":
+                    job = item
+                    writer = upload_writer = None
+                    step = upload_step(job.fps, self.upload_fps)
+
+                elif kind == "frame" and job is not None:
+                    t0 = time.perf_counter()
+                    if writer is None:
+                        h, w = item.frame.shape[:2]
+                        size = (w, h)
+                        writer = open_writer(job.path, job.fps, size, self.encoder)
+                        job.encoder = writer.codec
+                        if job.upload_path != job.path:
+                            upload_size = scaled_size(w, h, self.upload_scale)
+                            upload_writer = open_writer(job.upload_path, max(1.0, job.fps / step), upload_size, self.encoder)
+
+                    writer.write(item.frame)
+                    if upload_writer is not None and job.frames_written % step == 0:
+                        img = item.frame
+                        if upload_size != size:
+                            img = cv2.resize(img, upload_size, interpolation=cv2.INTER_AREA)
+                        upload_writer.write(img)
+                    job.frames_written += 1
+                    job.encode_seconds += time.perf_counter() - t0
+                    job.artifacts.add(item)
+
+                elif kind == "close" and job is not None:
+                    t0 = time.perf_counter()
+                    try:
+                        if writer is not None:
+                            writer.release()
+                        if upload_writer is not None:
+                            upload_writer.release()
+                    except Exception as e:
+                        # Still report the events, even if the clip is broken
+                        print("Clip error:", e)
+                    job.encode_seconds += time.perf_counter() - t0
+                    finished, job = job, None
+                    writer = upload_writer = None
+
+                    if os.path.exists(finished.path):
+                        finished.bytes = os.path.getsize(finished.path)
+                    try:
+                        finished.artifact_paths = finished.artifacts.save(finished.path, round(finished.fps, 2))
+                    except Exception as e:
+                        print("Thumbnail error:", e)
+                    finished.artifacts = None
+                    print(
+                        f"Clip {finished.path}: {finished.frames_written} frames, "
+                        f"{finished.bytes} bytes at {finished.fps:.1f} fps, "
+                        f"encoded at {finished.encode_fps or 0:.1f} fps ({finished.encoder})"
+                    )
+                    self.done.put(finished)
+
+            except Exception as e:
+                print("Clip error:", e)
+            finally:
+                self.queue.task_done()
+
+    def _complete(self):
+        while True:
+            finished = self.done.get()
+            try:
+                self.on_complete(finished)
+            except Exception as e:
+                print("Clip error:", e)
+            finally:
+                self.done.task_done()
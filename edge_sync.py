@@ -0,0 +1,273 @@
+import threading
+import time
+import uuid
+
+import event_json
+import event_wire
+import events_db
+import metrics
+import scan_channel
+
+# -------------------------------
+# EDGE STORE-AND-FORWARD SYNC
+# -------------------------------
+#
+# The edge node writes every event to its own events.db first and a
+# background worker pushes rows past the high-water mark to the cloud /insert
+# in batches. A batch's row range is saved before it is sent and reused
+# until the server accepts it, so a retry always carries the same rows and
+# the same Idempotency-Key ("<node>:<nonce>:<first id>-<last id>"); the
+# server ignores a key it has already committed. The nonce is drawn once per
+# database and target, so a recreated events.db or two nodes sharing a
+# hostname never reuse the keys of rows the server has already seen.
+#
+# Links filled in later (a violation's clip once it is uploaded) go through
+# update_event(), which queues the row in sync_resend if it may already
+# have been sent. Those rows are sent again without a key: the server
+# upserts on event_uid, so a repeat only fills in the links again.
+#
+# With a heartbeat_url the worker also posts the node's tracker state and
+# backlog every heartbeat_interval seconds, so the cloud /cameras view
+# knows a door is alive even when it has no new events.
+#
+# Batches go out in the compact event_wire format (wire="compact") or as
+# plain JSON (wire="json"), over one keep-alive session. Link fields that
+# still hold a path on this box (the telemetry of a verified scan, which is
+# never uploaded) are sent empty; the cloud cannot open them.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sync_state (
+ target TEXT PRIMARY KEY,
+ hwm INTEGER DEFAULT 0,
+ pending_last INTEGER,
+ nonce TEXT
+);
+CREATE TABLE IF NOT EXISTS sync_resend (
+ seq INTEGER PRIMARY KEY AUTOINCREMENT,
+ target TEXT,
+ event_id INTEGER
+);
+"""
+
+
+def _remote_links(event):
+    # Uploaded links are URLs; anything else is a file on this box
+    for f in events_db.UPSERT_FIELDS:
+        if event.get(f) and "://" not in event[f]:
+            event[f] = None
+    return event
+
+
+def init(db):
+    db.executescript(SCHEMA)
+    columns = {row[1] for row in db.execute("PRAGMA table_info(sync_state)")}
+    if "nonce" not in columns:
+        db.execute("ALTER TABLE sync_state ADD COLUMN nonce TEXT")
+    db.commit()
+
+
+def record_event(db, event):
+    # Local write that never depends on the uplink.
+    fields = [f for f in events_db.INSERT_FIELDS if f in event]
+    cur = db.execute(
+        f"INSERT INTO events ({', '.join(fields)}) VALUES ({', '.join('?' for _ in fields)})",
+        [event[f] for f in fields]
+    )
+    db.commit()
+    return cur.lastrowid
+
+
+def update_event(db, event_uid, fields):
+    # Fills in fields of a recorded event (None leaves a field as it is)
+    # and queues it to be sent again to every target
+    fields = {f: v for f, v in fields.items() if v is not None}
+    if not fields:
+        return False
+    cur = db.execute(
+        f"UPDATE events SET {', '.join(f'{f} = ?' for f in fields)} WHERE event_uid = ?",
+        list(fields.values()) + [event_uid]
+    )
+    if cur.rowcount:
+        db.execute("""
+        INSERT INTO sync_resend (target, event_id)
+        SELECT target, (SELECT id FROM events WHERE event_uid = ?) FROM sync_state
+        """, (event_uid,))
+    db.commit()
+    return cur.rowcount > 0
+
+
+class SyncWorker:
+    def __init__(self, db_path, url, node_id, batch_size=100, interval=2.0,
+                 timeout=5, max_backoff=60.0, post=None, wire="compact",
+                 heartbeat_url=None, heartbeat_interval=30.0):
+        self.db = events_db.connect(db_path)
+        init(self.db)
+        self.url = url
+        self.node_id = node_id
+        self.batch_size = batch_size
+        self.interval = interval
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self.wire = wire
+        self.heartbeat_url = heartbeat_url
+        self.heartbeat_interval = heartbeat_interval
+        self.last_heartbeat = 0.0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        if post is None:
+            import requests
+            post = requests.Session().post
+        self.post = post
+
+        self.db.execute("INSERT OR IGNORE INTO sync_state (target, hwm) VALUES (?, 0)", (url,))
+        self.db.execute(
+            "UPDATE sync_state SET nonce = ? WHERE target = ? AND nonce IS NULL", (uuid.uuid4().hex, url)
+        )
+        self.db.commit()
+        self.nonce = self.db.execute("SELECT nonce FROM sync_state WHERE target = ?", (url,)).fetchone()[0]
+
+    def _state(self):
+        return self.db.execute(
+            "SELECT hwm, pending_last FROM sync_state WHERE target = ?", (self.url,)
+        ).fetchone()
+
+    def backlog(self):
+        hwm, _ = self._state()
+        new = self.db.execute("SELECT COUNT(*) FROM events WHERE id > ?", (hwm,)).fetchone()[0]
+        updated = self.db.execute("SELECT COUNT(*) FROM sync_resend WHERE target = ?", (self.url,)).fetchone()[0]
+        return new + updated
+
+    def run_once(self):
+        # Sends one batch of new rows, then one of rows updated after they
+        # were sent; returns the number of rows acknowledged.
+        return self._send_new() + self._resend_updated()
+
+    def _post(self, events, headers):
+        if self.wire == "compact":
+            body, wire_headers = event_wire.encode(events)
+            headers.update(wire_headers)
+        else:
+            body = event_json.dumps({"events": events})
+            headers["Content-Type"] = "application/json"
+
+        resp = self.post(self.url, data=body, headers=headers, timeout=self.timeout)
+        if resp.status_code >= 300:
+            raise RuntimeError(f"sync rejected with HTTP {resp.status_code}")
+        metrics.inc("sync.batches")
+        metrics.inc("sync.bytes", len(body))
+
+    def _send_new(self):
+        hwm, pending_last = self._state()
+
+        if pending_last is None:
+            row = self.db.execute("""
+            SELECT MAX(id) FROM (SELECT id FROM events WHERE id > ? ORDER BY id LIMIT ?)
+            """, (hwm, self.batch_size)).fetchone()
+            if row[0] is None:
+                return 0
+            pending_last = row[0]
+            self.db.execute("UPDATE sync_state SET pending_last = ? WHERE target = ?", (pending_last, self.url))
+            self.db.commit()
+
+        rows = self.db.execute(f"""
+        SELECT {', '.join(events_db.INSERT_FIELDS)} FROM events
+        WHERE id > ? AND id <= ? ORDER BY id
+        """, (hwm, pending_last)).fetchall()
+        events = [_remote_links(dict(zip(events_db.INSERT_FIELDS, r))) for r in rows]
+
+        self._post(events, {"Idempotency-Key": f"{self.node_id}:{self.nonce}:{hwm + 1}-{pending_last}"})
+
+        self.db.execute(
+            "UPDATE sync_state SET hwm = ?, pending_last = NULL WHERE target = ?",
+            (pending_last, self.url)
+        )
+        self.db.commit()
+        metrics.inc("sync.events", len(events))
+        return len(events)
+
+    def _resend_updated(self):
+        # Rows past the high-water mark are left queued: the new-row batch
+        # that carries them may have been read before the update
+        hwm, _ = self._state()
+        queued = self.db.execute("""
+        SELECT seq, event_id FROM sync_resend WHERE target = ? AND event_id <= ?
+        ORDER BY seq LIMIT ?
+        """, (self.url, hwm, self.batch_size)).fetchall()
+        if not queued:
+            return 0
+
+        ids = sorted({event_id for _, event_id in queued})
+        rows = self.db.execute(f"""
+        SELECT {', '.join(events_db.INSERT_FIELDS)} FROM events
+        WHERE id IN ({', '.join('?' for _ in ids)}) ORDER BY id
+        """, ids).fetchall()
+        events = [_remote_links(dict(zip(events_db.INSERT_FIELDS, r))) for r in rows]
+
+        if events:
+            self._post(events, {})
+
+        seqs = [seq for seq, _ in queued]
+        self.db.execute(
+            f"DELETE FROM sync_resend WHERE target = ? AND seq IN ({', '.join('?' for _ in seqs)})",
+            [self.url] + seqs
+        )
+        self.db.commit()
+        metrics.inc("sync.resent", len(events))
+        return len(events)
+
+    def send_heartbeat(self):
+        resp = self.post(
+            self.heartbeat_url,
+            json={
+                "node_id": self.node_id,
+                "cameras": scan_channel.read_state(self.db),
+                "backlog": self.backlog(),
+                # Event timestamps are node-local; lets the cloud tell which day is today here
+                "utc_offset": time.localtime().tm_gmtoff,
+            },
+            timeout=self.timeout
+        )
+        if resp.status_code >= 300:
+            raise RuntimeError(f"heartbeat rejected with HTTP {resp.status_code}")
+        self.last_heartbeat = time.time()
+        metrics.inc("sync.heartbeats")
+
+    def _loop(self):
+        while not self.stop_event.is_set():
+            if self.heartbeat_url and time.time() - self.last_heartbeat >= self.heartbeat_interval:
+                try:
+                    self.send_heartbeat()
+                except Exception as e:
+                    # Retried next round; never holds up the event sync
+                    self.last_heartbeat = time.time()
+                    print("Heartbeat error:", e)
+
+            try:
+                sent = self.run_once()
+                self.failures = 0
+            except Exception as e:
+                self.failures += 1
+                metrics.inc("sync.failures")
+                print("Sync error:", e)
+                sent = 0
+
+            metrics.set_gauge("sync.backlog", self.backlog())
+
+            if self.failures:
+                wait = min(self.max_backoff, self.interval * 2 ** (self.failures - 1))
+            elif sent >= self.batch_size:
+                wait = 0  # more rows are already waiting
+            else:
+                wait = self.interval
+            self.stop_event.wait(wait)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
@@ -0,0 +1,249 @@
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+import events_db
+import metrics
+
+# -------------------------------
+# EVENT ARCHIVE + ROLLUPS
+# -------------------------------
+#
+# `events` is the hot table: only the last HOT_DAYS of events stay in it.
+# archive_old() moves older rows into one table per month (events_YYYYMM)
+# with the same columns and ids. Hourly and daily counts per camera and
+# status are kept in rollup_hourly / rollup_daily by an insert trigger, so
+# they are exact for new rows (an upsert of an existing event_uid does not
+# count twice) and survive archiving. Historical charts read the rollups
+# instead of scanning events. Every API worker starts an Archiver, but only
+# the holder of the archive_lease row moves rows; the others take over if
+# it stops renewing.
+
+HOT_DAYS = 30
+ARCHIVE_BATCH = 5000
+
+ROLLUPS = [
+    # (table, key column, length of the timestamp prefix)
+    ("rollup_hourly", "hour", 13),
+    ("rollup_daily", "day", 10),
+]
+
+
+def init(conn):
+    with events_db.migration(conn):
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_events_timestamp ON events (timestamp)")
+        conn.execute("CREATE TABLE IF NOT EXISTS archive_lease (name TEXT PRIMARY KEY, holder TEXT, expires REAL)")
+
+        # Archive tables created before a column was added get it too, so
+        # archiving and exports can keep using EVENT_FIELDS; the uid index
+        # lets a replay of an archived event find its row
+        for table in archive_tables(conn):
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            for name, kind in events_db.ADDED_COLUMNS:
+                if name not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {kind}")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_uid ON {table} (event_uid)")
+
+        for table, key, width in ROLLUPS:
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+            ).fetchone()
+
+            conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+             {key} TEXT,
+             camera_id TEXT,
+             status TEXT,
+             count INTEGER,
+             PRIMARY KEY ({key}, camera_id, status)
+            )
+            """)
+
+            conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON events
+            BEGIN
+             INSERT INTO {table} ({key}, camera_id, status, count)
+             VALUES (substr(NEW.timestamp, 1, {width}), NEW.camera_id, NEW.status, 1)
+             ON CONFLICT({key}, camera_id, status) DO UPDATE SET count = count + 1;
+            END
+            """)
+
+            if not exists:
+                # First run on an existing database: backfill from every partition
+                for source in ["events"] + archive_tables(conn):
+                    conn.execute(f"""
+                    INSERT INTO {table} ({key}, camera_id, status, count)
+                    SELECT substr(timestamp, 1, {width}), camera_id, status, COUNT(*)
+                    FROM {source} GROUP BY 1, 2, 3
+                    ON CONFLICT({key}, camera_id, status) DO UPDATE SET count = count + excluded.count
+                    """)
+
+
+def archive_tables(conn):
+    rows = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB 'events_[0-9][0-9][0-9][0-9][0-9][0-9]' ORDER BY name"
+    ).fetchall()
+    return [r[0] for r in rows]
+
+
+def partitions(conn, since=None, until=None):
+    # Archive tables overlapping [since, until] oldest first, then the hot
+    # table; used by exports that need the full history.
+    tables = []
+    for name in archive_tables(conn):
+        month = f"{name[7:11]}-{name[11:13]}"
+        if since and month < since[:7]:
+            continue
+        if until and month > until[:7]:
+            continue
+        tables.append(name)
+    return tables + ["events"]
+
+
+def _unsynced_floor(conn):
+    # On an edge node, rows the sync worker has not forwarded yet (or has
+    # queued to send again) must stay in the hot table; returns the highest
+    # id that may be archived.
+    has_sync = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sync_state'"
+    ).fetchone()
+    if not has_sync:
+        return None
+    floor = conn.execute("SELECT MIN(hwm) FROM sync_state").fetchone()[0]
+
+    has_resend = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sync_resend'"
+    ).fetchone()
+    if has_resend and floor is not None:
+        resend = conn.execute("SELECT MIN(event_id) FROM sync_resend").fetchone()[0]
+        if resend is not None:
+            floor = min(floor, resend - 1)
+    return floor
+
+
+def archive_old(conn, hot_days=HOT_DAYS, now=None):
+    # Moves events older than hot_days into monthly tables, a batch per
+    # transaction so API writers are never blocked for long. Returns the
+    # number of rows moved.
+    now = now or datetime.now()
+    cutoff = (now - timedelta(days=hot_days)).strftime("%Y-%m-%d %H:%M:%S")
+    max_id = _unsynced_floor(conn)
+    cols = ", ".join(events_db.EVENT_FIELDS)
+    moved = 0
+
+    while True:
+        params = [cutoff]
+        id_guard = ""
+        if max_id is not None:
+            id_guard = "AND id <= ?"
+            params.append(max_id)
+
+        rows = conn.execute(f"""
+        SELECT id, substr(timestamp, 1, 7) FROM events
+        WHERE timestamp < ? {id_guard}
+        ORDER BY timestamp LIMIT ?
+        """, params + [ARCHIVE_BATCH]).fetchall()
+
+        if not rows:
+            break
+
+        by_month = {}
+        for row_id, month in rows:
+            by_month.setdefault(month, []).append(row_id)
+
+        with conn:
+            for month, ids in by_month.items():
+                table = events_db.partition_name(month)
+                conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                 id INTEGER PRIMARY KEY,
+                 timestamp TEXT,
+                 status TEXT,
+                 clip_path TEXT,
+                 camera_id TEXT,
+                 {", ".join(f"{name} {kind}" for name, kind in events_db.ADDED_COLUMNS)}
+                )
+                """)
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_uid ON {table} (event_uid)")
+                marks = ", ".join("?" for _ in ids)
+                conn.execute(f"INSERT OR IGNORE INTO {table} ({cols}) SELECT {cols} FROM events WHERE id IN ({marks})", ids)
+                conn.execute(f"DELETE FROM events WHERE id IN ({marks})", ids)
+
+        moved += len(rows)
+
+    if moved:
+        metrics.inc("archive.rows_moved", moved)
+    return moved
+
+
+def take_lease(conn, holder, ttl, now=None):
+    # True if `holder` has the archive lease, renewed for ttl seconds
+    now = now or time.time()
+    with conn:
+        conn.execute("""
+        INSERT INTO archive_lease (name, holder, expires) VALUES ('archive', ?, ?)
+        ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires = excluded.expires
+        WHERE archive_lease.holder = excluded.holder OR archive_lease.expires < ?
+        """, (holder, now + ttl, now))
+    row = conn.execute("SELECT holder FROM archive_lease WHERE name = 'archive'").fetchone()
+    return row[0] == holder
+
+
+def rollups(conn, granularity="day", since=None, until=None, camera_id=None):
+    table, key, _ = ROLLUPS[0] if granularity == "hour" else ROLLUPS[1]
+    where, params = [], []
+    if since:
+        where.append(f"{key} >= ?")
+        params.append(since)
+    if until:
+        where.append(f"{key} <= ?")
+        params.append(until)
+    if camera_id:
+        where.append("camera_id = ?")
+        params.append(camera_id)
+
+    sql = f"SELECT {key}, camera_id, status, count FROM {table}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {key}, camera_id, status"
+
+    return [
+        {key: k, "camera_id": cam, "status": status, "count": count}
+        for k, cam, status, count in conn.execute(sql, params)
+    ]
+
+
+class Archiver:
+    # Background thread that runs archive_old() on its own connection.
+    def __init__(self, db_path, hot_days=HOT_DAYS, interval=3600):
+        self.db_path = db_path
+        self.hot_days = hot_days
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+
+    def _loop(self):
+        db = events_db.connect(self.db_path)
+        holder = f"{socket.gethostname()}:{os.getpid()}"
+        while not self.stop_event.is_set():
+            try:
+                if not take_lease(db, holder, self.interval * 2):
+                    self.stop_event.wait(self.interval)
+                    continue
+                started = time.perf_counter()
+                moved = archive_old(db, self.hot_days)
+                if moved:
+                    print(f"Archived {moved} events in {time.perf_counter() - started:.1f}s")
+            except Exception as e:
+                print("Archive error:", e)
+            self.stop_event.wait(self.interval)
+        db.close()
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
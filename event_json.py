@@ -0,0 +1,36 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# -------------------------------
+# EVENT SERIALIZATION
+# -------------------------------
+#
+# Event rows come out of sqlite as tuples. Instead of building a dict per
+# row by index and going through jsonify, rows are either zipped against
+# the column names once (the default "events" shape) or sent column-
+# oriented as {"columns": [...], "rows": [[...], ...]} which skips per-row
+# dicts entirely. orjson is used when installed; the stdlib encoder is the
+# fallback.
+
+
+def dumps(obj):
+    # Returns compact UTF-8 JSON bytes
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def rows_payload(fields, rows, columns=False):
+    if columns:
+        return {"columns": fields, "rows": rows}
+    return {"events": [dict(zip(fields, r)) for r in rows]}
+
+
+def ndjson_lines(fields, rows):
+    if orjson is not None:
+        return b"".join(orjson.dumps(dict(zip(fields, r))) + b"\n" for r in rows)
+    return "".join(json.dumps(dict(zip(fields, r)), separators=(",", ":")) + "\n" for r in rows).encode()
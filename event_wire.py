@@ -0,0 +1,253 @@
+import json
+import zlib
+from datetime import datetime, timedelta
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+import events_db
+
+# -------------------------------
+# COMPACT EDGE -> CLOUD BATCHES
+# -------------------------------
+#
+# A denser /insert body for metered uplinks. A batch is sent column-wise:
+#
+#   {"v": 1, "fields": [...], "strings": [...], "t0": 1718000000,
+#    "rows": [[...], ...]}
+#
+# - only the fields the batch actually uses are listed
+# - camera_id and status are indexes into "strings"
+# - timestamps are whole seconds after t0 (the batch's earliest event)
+#   instead of "YYYY-MM-DD HH:MM:SS" text; naive, so no timezone shifts
+# - with msgpack, an event_uid of the usual "<camera_id>-<32 hex>" form
+#   travels as its 16 raw bytes
+# - trailing empty fields of a row are dropped
+#
+# The container is msgpack when installed, JSON otherwise, and the body is
+# gzip (or zstd, when zstandard is installed) compressed. /insert still
+# accepts plain JSON; decode() returns the same {"events": [...]} shape.
+
+MSGPACK_TYPE = "application/vnd.axentry.batch+msgpack"
+JSON_TYPE = "application/vnd.axentry.batch+json"
+
+# Largest body accepted after decompression
+MAX_BODY = 32 * 1024 * 1024
+
+TS_FORMAT = "%Y-%m-%d %H:%M:%S"
+EPOCH = datetime(1970, 1, 1)
+DICT_FIELDS = ("camera_id", "status")
+
+
+class WireError(ValueError):
+    pass
+
+
+def _seconds(ts):
+    try:
+        return int((datetime.strptime(ts, TS_FORMAT) - EPOCH).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def _uid_bytes(uid, camera_id):
+    # "<camera_id>-<32 lowercase hex>" -> 16 bytes; anything else stays a
+    # string, since unpack() could not give back the same text for it
+    prefix = f"{camera_id}-"
+    if isinstance(uid, str) and uid.startswith(prefix) and len(uid) == len(prefix) + 32:
+        try:
+            raw = bytes.fromhex(uid[len(prefix):])
+        except ValueError:
+            return uid
+        if raw.hex() == uid[len(prefix):]:
+            return raw
+    return uid
+
+
+def pack(events, binary=True):
+    fields = [f for f in events_db.INSERT_FIELDS if any(e.get(f) is not None for e in events)]
+    strings = []
+    index = {}
+    seconds = [_seconds(e.get("timestamp")) for e in events]
+    t0 = min((s for s in seconds if s is not None), default=0)
+    rows = []
+
+    for event, secs in zip(events, seconds):
+        row = []
+        for f in fields:
+            value = event.get(f)
+            if value is None:
+                pass
+            elif f == "timestamp" and secs is not None:
+                value = secs - t0
+            elif f in DICT_FIELDS:
+                if value not in index:
+                    index[value] = len(strings)
+                    strings.append(value)
+                value = index[value]
+            elif f == "event_uid" and binary:
+                value = _uid_bytes(value, event.get("camera_id"))
+            row.append(value)
+
+        while row and row[-1] is None:
+            row.pop()
+        rows.append(row)
+
+    return {"v": 1, "fields": fields, "strings": strings, "t0": t0, "rows": rows}
+
+
+def _is_int(value):
+    # bool is an int subclass but never a valid index or offset
+    return type(value) is int
+
+
+def _str_list(value):
+    return isinstance(value, list) and all(isinstance(v, str) for v in value)
+
+
+def unpack(batch):
+    if not isinstance(batch, dict) or batch.get("v") != 1:
+        raise WireError("unsupported batch version")
+
+    try:
+        fields = batch.get("fields") or []
+        strings = batch.get("strings") or []
+        t0 = batch.get("t0") or 0
+        rows = batch["rows"]
+        if not _str_list(fields) or not _str_list(strings) or not _is_int(t0) or not isinstance(rows, list):
+            raise WireError("malformed batch header")
+        if not set(fields) <= set(events_db.INSERT_FIELDS):
+            raise WireError("unknown fields in batch")
+
+        events = []
+        for row in rows:
+            if not isinstance(row, list):
+                raise WireError("row is not a list")
+            if len(row) > len(fields):
+                raise WireError("row longer than fields")
+            event = dict.fromkeys(fields)
+            for f, value in zip(fields, row):
+                if value is None:
+                    pass
+                elif f == "timestamp" and _is_int(value):
+                    value = (EPOCH + timedelta(seconds=t0 + value)).strftime(TS_FORMAT)
+                elif f in DICT_FIELDS:
+                    if not _is_int(value) or not 0 <= value < len(strings):
+                        raise WireError(f"bad {f} index")
+                    value = strings[value]
+                elif not isinstance(value, str) and not (f == "event_uid" and isinstance(value, bytes)):
+                    raise WireError(f"bad {f} value")
+                event[f] = value
+            uid = event.get("event_uid")
+            if isinstance(uid, bytes):
+                event["event_uid"] = f"{event.get('camera_id')}-{uid.hex()}"
+            events.append(event)
+    except (KeyError, IndexError, TypeError, ValueError, OverflowError) as e:
+        if isinstance(e, WireError):
+            raise
+        raise WireError(f"malformed batch: {e}")
+
+    return {"events": events}
+
+
+def _check_event(event):
+    # Plain JSON events go straight to insert_events; every field is text
+    if not isinstance(event, dict):
+        raise WireError("events must be JSON objects")
+    for f in events_db.INSERT_FIELDS:
+        value = event.get(f)
+        if value is not None and not isinstance(value, str):
+            raise WireError(f"bad {f} value")
+
+
+def encode(events, compression="gzip"):
+    # Returns (body, headers) for one compact batch
+    if msgpack is not None:
+        body = msgpack.packb(pack(events, binary=True), use_bin_type=True)
+        content_type = MSGPACK_TYPE
+    else:
+        body = json.dumps(pack(events, binary=False), separators=(",", ":")).encode()
+        content_type = JSON_TYPE
+
+    headers = {"Content-Type": content_type}
+    if compression == "zstd" and zstandard is not None:
+        body = zstandard.ZstdCompressor(level=6).compress(body)
+        headers["Content-Encoding"] = "zstd"
+    elif compression:
+        # gzip framing from zlib, without the mtime gzip.compress() writes
+        packer = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        body = packer.compress(body) + packer.flush()
+        headers["Content-Encoding"] = "gzip"
+    return body, headers
+
+
+def _decompress(body, encoding):
+    if not encoding or encoding == "identity":
+        if len(body) > MAX_BODY:
+            raise WireError("body too large")
+        return body
+
+    if encoding == "gzip":
+        unpacker = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            out = unpacker.decompress(body, MAX_BODY + 1)
+        except zlib.error as e:
+            raise WireError(f"bad gzip body: {e}")
+    elif encoding == "zstd" and zstandard is not None:
+        chunks = []
+        size = 0
+        try:
+            reader = zstandard.ZstdDecompressor().stream_reader(body)
+            while size <= MAX_BODY:
+                chunk = reader.read(1 << 20)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                size += len(chunk)
+        except zstandard.ZstdError as e:
+            raise WireError(f"bad zstd body: {e}")
+        out = b"".join(chunks)
+    else:
+        raise WireError(f"unsupported Content-Encoding {encoding}")
+
+    # Guards against small bodies that expand enormously
+    if len(out) > MAX_BODY:
+        raise WireError("body too large")
+    return out
+
+
+def decode(body, content_type, content_encoding=None):
+    # Returns the parsed /insert body for any accepted wire format
+    raw = _decompress(body, (content_encoding or "").strip().lower())
+    content_type = (content_type or "").split(";")[0].strip().lower()
+
+    if content_type == MSGPACK_TYPE and msgpack is None:
+        raise WireError("msgpack batches are not supported by this server")
+
+    try:
+        if content_type == MSGPACK_TYPE:
+            data = msgpack.unpackb(raw, raw=False, max_bin_len=MAX_BODY)
+        else:
+            data = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise WireError(f"could not parse body: {e}")
+
+    if content_type in (MSGPACK_TYPE, JSON_TYPE):
+        return unpack(data)
+    if not isinstance(data, dict):
+        raise WireError("expected a JSON object")
+    if "events" in data:
+        if not isinstance(data["events"], list):
+            raise WireError("events must be a list")
+        for event in data["events"]:
+            _check_event(event)
+    else:
+        _check_event(data)
+    return data
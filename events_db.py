@@ -0,0 +1,218 @@
+import contextlib
+import sqlite3
+import time
+import uuid
+
+# -------------------------------
+# EVENTS TABLE SCHEMA
+# -------------------------------
+#
+# Shared by app.py and localcode.py. Columns added after the original five
+# are listed in ADDED_COLUMNS and migrated onto existing events.db files.
+# Each module's init() runs inside migration(), so API workers starting
+# together take turns instead of failing with "database is locked" while
+# the first one builds indexes and backfills on a large existing table.
+
+ADDED_COLUMNS = [
+    ("poster_path", "TEXT"),
+    ("strip_path", "TEXT"),
+    ("index_path", "TEXT"),
+    ("event_uid", "TEXT"),
+    ("telemetry_path", "TEXT"),
+]
+
+EVENT_FIELDS = ["id", "timestamp", "status", "clip_path", "camera_id"] + [c for c, _ in ADDED_COLUMNS]
+
+# Fields a client may send to /insert (everything but the row id)
+INSERT_FIELDS = EVENT_FIELDS[1:]
+
+# Filled in on a retry / replay of an event the server already has
+UPSERT_FIELDS = ["clip_path", "poster_path", "strip_path", "index_path", "telemetry_path"]
+
+# Query-string filters accepted by /events and /events/export; since/until
+# compare against the "YYYY-MM-DD HH:MM:SS" timestamp, so a date prefix
+# such as until=2024-06-30 works too (until is inclusive of that prefix).
+FILTER_ARGS = ("camera_id", "status", "since", "until")
+
+# Batch idempotency keys are remembered this long
+IDEMPOTENCY_TTL = 7 * 24 * 3600
+
+# How long a starting process waits for another one's schema setup
+MIGRATE_TIMEOUT = 600
+
+
+def connect(path):
+    # Separate connections per process / thread; WAL lets API workers insert
+    # while the vision loop and background threads read without blocking.
+    db = sqlite3.connect(path, timeout=5, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA busy_timeout=5000")
+    return db
+
+
+@contextlib.contextmanager
+def migration(conn):
+    # One write transaction taken up front (BEGIN IMMEDIATE), so the "does
+    # this exist yet" checks and the backfills they guard run in one
+    # process at a time; later callers find the work already done.
+    conn.commit()
+    timeout = conn.execute("PRAGMA busy_timeout").fetchone()[0]
+    conn.execute(f"PRAGMA busy_timeout = {MIGRATE_TIMEOUT * 1000}")
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+    finally:
+        conn.execute(f"PRAGMA busy_timeout = {timeout}")
+
+
+def init(conn):
+    with migration(conn):
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS events (
+         id INTEGER PRIMARY KEY AUTOINCREMENT,
+         timestamp TEXT,
+         status TEXT,
+         clip_path TEXT,
+         camera_id TEXT
+        )
+        """)
+
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(events)")}
+        for name, kind in ADDED_COLUMNS:
+            if name not in existing:
+                conn.execute(f"ALTER TABLE events ADD COLUMN {name} {kind}")
+
+        # Legacy rows have no uid; NULLs never conflict
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_events_uid ON events (event_uid)")
+
+        # Filtered /events queries are ordered by id
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_events_camera_status ON events (camera_id, status, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_events_status ON events (status, id)")
+
+        # Bumped on every change to events so read caches in any process can
+        # tell whether their copy is still current
+        conn.execute("CREATE TABLE IF NOT EXISTS table_versions (name TEXT PRIMARY KEY, version INTEGER)")
+        conn.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES ('events', 0)")
+        for op in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS events_version_{op.lower()} AFTER {op} ON events
+            BEGIN
+             UPDATE table_versions SET version = version + 1 WHERE name = 'events';
+            END
+            """)
+
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+         key TEXT PRIMARY KEY,
+         created_at REAL,
+         inserted INTEGER
+        )
+        """)
+
+
+def table_version(conn, name="events"):
+    return conn.execute("SELECT version FROM table_versions WHERE name = ?", (name,)).fetchone()[0]
+
+
+def filter_clause(filters):
+    # Returns (" WHERE ..." or "", params) for the filters that are set.
+    where, params = [], []
+    if filters.get("camera_id"):
+        where.append("camera_id = ?")
+        params.append(filters["camera_id"])
+    if filters.get("status"):
+        where.append("status = ?")
+        params.append(filters["status"])
+    if filters.get("since"):
+        where.append("timestamp >= ?")
+        params.append(filters["since"])
+    if filters.get("until"):
+        # "\uffff" makes a date-only bound cover the whole day
+        where.append("timestamp <= ?")
+        params.append(filters["until"] + "\uffff")
+    return (" WHERE " + " AND ".join(where)) if where else "", params
+
+
+def partition_name(timestamp):
+    # Monthly archive table an event's row moves to: events_YYYYMM
+    return "events_" + timestamp[:7].replace("-", "")
+
+
+def _archived_uids(conn, events):
+    # {event_uid: archive table} for events of the batch that were already
+    # moved out of the hot table; looked up in the event's own month only
+    by_table = {}
+    for e in events:
+        uid, ts = e.get("event_uid"), e.get("timestamp")
+        if uid and isinstance(ts, str):
+            by_table.setdefault(partition_name(ts), []).append(uid)
+    if not by_table:
+        return {}
+
+    tables = [r[0] for r in conn.execute(
+        f"SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB 'events_[0-9][0-9][0-9][0-9][0-9][0-9]' "
+        f"AND name IN ({', '.join('?' for _ in by_table)})",
+        list(by_table)
+    )]
+    found = {}
+    for table in tables:
+        uids = by_table[table]
+        for (uid,) in conn.execute(
+                f"SELECT event_uid FROM {table} WHERE event_uid IN ({', '.join('?' for _ in uids)})", uids):
+            found[uid] = table
+    return found
+
+
+def new_event_uid(camera_id):
+    return f"{camera_id}-{uuid.uuid4().hex}"
+
+
+def insert_events(conn, events, idempotency_key=None):
+    # Inserts a batch in one transaction. With an idempotency key, a batch
+    # that was already committed (the client retried after losing our
+    # response) is not inserted again; returns (inserted, duplicate).
+    # Events carrying an event_uid are upserted, so a replay of a row the
+    # server already has only fills in clip/preview links, also when that
+    # row has been archived.
+    placeholders = ", ".join("?" for _ in INSERT_FIELDS)
+    updates = ", ".join(f"{f} = COALESCE(excluded.{f}, {f})" for f in UPSERT_FIELDS)
+    sql = f"""
+    INSERT INTO events ({', '.join(INSERT_FIELDS)}) VALUES ({placeholders})
+    ON CONFLICT(event_uid) DO UPDATE SET {updates}
+    """
+    archived_sets = ", ".join(f"{f} = COALESCE(?, {f})" for f in UPSERT_FIELDS)
+    rows = [tuple(e.get(f) for f in INSERT_FIELDS) for e in events]
+
+    with conn:
+        if idempotency_key is not None:
+            now = time.time()
+            conn.execute("DELETE FROM idempotency_keys WHERE created_at < ?", (now - IDEMPOTENCY_TTL,))
+            try:
+                conn.execute(
+                    "INSERT INTO idempotency_keys (key, created_at, inserted) VALUES (?, ?, ?)",
+                    (idempotency_key, now, len(rows))
+                )
+            except sqlite3.IntegrityError:
+                seen = conn.execute(
+                    "SELECT inserted FROM idempotency_keys WHERE key = ?", (idempotency_key,)
+                ).fetchone()
+                return seen[0], True
+
+        archived = _archived_uids(conn, events)
+        for e in events:
+            if e.get("event_uid") in archived:
+                conn.execute(
+                    f"UPDATE {archived[e['event_uid']]} SET {archived_sets} WHERE event_uid = ?",
+                    [e.get(f) for f in UPSERT_FIELDS] + [e["event_uid"]]
+                )
+
+        conn.executemany(sql, [
+            row for e, row in zip(events, rows) if e.get("event_uid") not in archived
+        ])
+
+    return len(rows), False
@@ -0,0 +1,164 @@
+import json
+import sys
+
+import numpy as np
+
+# -------------------------------
+# PER-SCAN FLIGHT RECORDER
+# -------------------------------
+#
+# A fixed-size ring of per-frame telemetry kept next to the frame buffer:
+# capture time, stage timings, the tracker's ids and boxes, which of them
+# were in the door zone, and the scan state (primary id, when a secondary
+# person was first seen, whether the scan was flagged). Everything lives in
+# preallocated numpy arrays, so recording a frame allocates nothing.
+#
+# At each verdict the frames of that scan are saved as a compressed .npz
+# next to the clips and linked from the event (telemetry_path). replay()
+# re-runs the tailgating rule on the saved detections, so a disputed
+# verdict can be checked offline without the video or the model.
+#
+#   python flight_recorder.py clips/scan_CAM_01_....npz
+
+MAX_BOXES = 16
+
+
+class FlightRecorder:
+    def __init__(self, capacity=2048, max_boxes=MAX_BOXES):
+        self.capacity = capacity
+        self.max_boxes = max_boxes
+        self.count = 0
+        self.t = np.zeros(capacity, np.float64)
+        self.read_ms = np.full(capacity, np.nan, np.float32)
+        self.detect_ms = np.full(capacity, np.nan, np.float32)
+        self.loop_ms = np.full(capacity, np.nan, np.float32)
+        self.detected = np.zeros(capacity, np.bool_)
+        self.n_boxes = np.zeros(capacity, np.uint8)
+        self.ids = np.full((capacity, max_boxes), -1, np.int32)
+        self.boxes = np.zeros((capacity, max_boxes, 4), np.float32)
+        self.in_zone = np.zeros((capacity, max_boxes), np.bool_)
+        self.scanning = np.zeros(capacity, np.bool_)
+        self.primary_id = np.full(capacity, -1, np.int32)
+        self.secondary_t = np.full(capacity, np.nan, np.float64)
+        self.flagged = np.zeros(capacity, np.bool_)
+
+    def add(self, t, ids, boxes, zone_ids, detected, read_ms=None, detect_ms=None):
+        # Starts the row for a frame; scan state and loop time are filled
+        # in later with set()
+        i = self.count % self.capacity
+        self.count += 1
+
+        n = min(len(ids), self.max_boxes)
+        self.t[i] = t
+        self.read_ms[i] = np.nan if read_ms is None else read_ms
+        self.detect_ms[i] = np.nan if detect_ms is None else detect_ms
+        self.loop_ms[i] = np.nan
+        self.detected[i] = detected
+        self.n_boxes[i] = n
+        self.ids[i] = -1
+        self.in_zone[i] = False
+        for j in range(n):
+            self.ids[i, j] = ids[j]
+            self.boxes[i, j] = boxes[j]
+            self.in_zone[i, j] = ids[j] in zone_ids
+        self.scanning[i] = False
+        self.primary_id[i] = -1
+        self.secondary_t[i] = np.nan
+        self.flagged[i] = False
+
+    def set(self, scanning=None, primary_id=None, secondary_t=None, flagged=None, loop_ms=None):
+        # Updates the most recent frame
+        if not self.count:
+            return
+        i = (self.count - 1) % self.capacity
+        if scanning is not None:
+            self.scanning[i] = scanning
+        if primary_id is not None:
+            self.primary_id[i] = primary_id
+        if secondary_t is not None:
+            self.secondary_t[i] = secondary_t
+        if flagged is not None:
+            self.flagged[i] = flagged
+        if loop_ms is not None:
+            self.loop_ms[i] = loop_ms
+
+    def window(self, start_t, end_t):
+        # Row indexes for frames in [start_t, end_t], oldest first
+        n = min(self.count, self.capacity)
+        order = (np.arange(n) + self.count - n) % self.capacity
+        t = self.t[order]
+        return order[(t >= start_t) & (t <= end_t)]
+
+    def save(self, path, start_t, end_t, meta):
+        rows = self.window(start_t, end_t)
+        width = int(self.n_boxes[rows].max()) if len(rows) else 0
+        np.savez_compressed(
+            path,
+            meta=np.array(json.dumps(meta)),
+            t=self.t[rows],
+            read_ms=self.read_ms[rows],
+            detect_ms=self.detect_ms[rows],
+            loop_ms=self.loop_ms[rows],
+            detected=self.detected[rows],
+            n_boxes=self.n_boxes[rows],
+            # Trimmed to the most boxes any saved frame had
+            ids=self.ids[rows, :width],
+            boxes=self.boxes[rows, :width],
+            in_zone=self.in_zone[rows, :width],
+            scanning=self.scanning[rows],
+            primary_id=self.primary_id[rows],
+            secondary_t=self.secondary_t[rows],
+            flagged=self.flagged[rows],
+        )
+        return path
+
+
+def load(path):
+    with np.load(path) as data:
+        out = {k: data[k] for k in data.files}
+    out["meta"] = json.loads(str(out["meta"]))
+    return out
+
+
+def replay(data, tolerance=None):
+    # Same rule as the loop in app.py: the first in-zone id is the primary;
+    # any other in-zone id for `tolerance` seconds flags the scan
+    tolerance = data["meta"].get("tolerance_seconds", 1.0) if tolerance is None else tolerance
+    primary = None
+    secondary_since = None
+    flagged = False
+
+    for i in np.flatnonzero(data["scanning"]):
+        zone = [int(tid) for tid, inside in zip(data["ids"][i], data["in_zone"][i]) if inside and tid >= 0]
+        t = float(data["t"][i])
+
+        if primary is None and zone:
+            # The loop picks from a set; use its choice when it was recorded
+            recorded = int(data["primary_id"][i])
+            primary = recorded if recorded in zone else zone[0]
+        secondary = [tid for tid in zone if tid != primary] if primary is not None else []
+
+        if secondary:
+            if secondary_since is None:
+                secondary_since = t
+            elif t - secondary_since >= tolerance:
+                flagged = True
+        else:
+            secondary_since = None
+
+    return {"primary_id": primary, "flagged": flagged}
+
+
+if __name__ == "__main__":
+    data = load(sys.argv[1])
+    meta = data["meta"]
+    scanning = data["scanning"]
+    result = replay(data)
+
+    print(json.dumps(meta, indent=2))
+    print(f"{len(data['t'])} frames ({int(scanning.sum())} scanning), "
+          f"{int(data['detected'].sum())} detector runs, "
+          f"median detect {np.nanmedian(data['detect_ms']):.1f} ms, "
+          f"median loop {np.nanmedian(data['loop_ms']):.1f} ms")
+    print(f"Recorded verdict: {meta.get('status')}; replayed: "
+          f"{'UNAUTHORIZED' if result['flagged'] else 'VERIFIED'} (primary {result['primary_id']})")
@@ -0,0 +1,98 @@
+from collections import namedtuple
+
+import metrics
+
+# -------------------------------
+# LOAD SHEDDING
+# -------------------------------
+#
+# Watches per-frame latency in the vision loop against a target. When the
+# box cannot keep up it steps down a ladder of cheaper settings, cosmetic
+# ones first: fewer preview refreshes, then a smaller inference imgsz, then
+# running the detector on fewer frames (boxes are predicted in between).
+# When there is headroom again it steps back up. The restore threshold is
+# well below the target and needs a longer streak, so the level does not
+# flap around the boundary.
+
+LoadLevel = namedtuple("LoadLevel", ["imgsz", "detect_interval", "preview_every"])
+
+LEVELS = [
+    LoadLevel(640, 1, 1),
+    LoadLevel(640, 1, 3),
+    LoadLevel(512, 1, 3),
+    LoadLevel(416, 1, 3),
+    LoadLevel(416, 2, 6),
+    LoadLevel(320, 2, 6),
+    LoadLevel(320, 3, 10),
+]
+
+
+class LoadController:
+    def __init__(self, target_ms, levels=LEVELS, alpha=0.1,
+                 degrade_frames=15, restore_frames=90, restore_ratio=0.6):
+        # target_ms of 0 disables shedding; the loop stays at levels[0]
+        self.target_ms = target_ms
+        self.levels = levels
+        self.alpha = alpha
+        self.degrade_frames = degrade_frames
+        self.restore_frames = restore_frames
+        self.restore_ratio = restore_ratio
+        self.index = 0
+        self.frames = 0
+        self.frame_ms = None
+        self.over = 0
+        self.under = 0
+        self._publish()
+
+    @property
+    def level(self):
+        return self.levels[self.index]
+
+    def show_preview(self):
+        return self.frames % self.level.preview_every == 0
+
+    def observe(self, frame_ms):
+        self.frames += 1
+        if self.frame_ms is None:
+            self.frame_ms = frame_ms
+        else:
+            self.frame_ms += self.alpha * (frame_ms - self.frame_ms)
+        metrics.set_gauge("load.frame_ms", round(self.frame_ms, 1))
+
+        if not self.target_ms:
+            return
+
+        if self.frame_ms > self.target_ms:
+            self.over += 1
+            self.under = 0
+        elif self.frame_ms < self.target_ms * self.restore_ratio:
+            self.under += 1
+            self.over = 0
+        else:
+            self.over = self.under = 0
+
+        if self.over >= self.degrade_frames and self.index < len(self.levels) - 1:
+            self._move(1, "degraded")
+        elif self.under >= self.restore_frames and self.index > 0:
+            self._move(-1, "restored")
+
+    def _move(self, step, reason):
+        old = self.level
+        self.index += step
+        self.over = self.under = 0
+        # The average still holds the old level's frames; start over
+        self.frame_ms = None
+
+        metrics.inc(f"load.{reason}")
+        self._publish()
+        new = self.level
+        print(
+            f"Load {reason} to level {self.index}: imgsz {old.imgsz}->{new.imgsz}, "
+            f"detect every {new.detect_interval}, preview every {new.preview_every} "
+            f"(target {self.target_ms} ms)"
+        )
+
+    def _publish(self):
+        metrics.set_gauge("load.level", self.index)
+        metrics.set_gauge("load.imgsz", self.level.imgsz)
+        metrics.set_gauge("load.detect_interval", self.level.detect_interval)
@@ -1,12 +1,17 @@
 from ultralytics import YOLO
 import cv2
 import time
-from collections import deque
 from datetime import datetime
 import os
-from flask import Flask, jsonify, send_from_directory
+from flask import Flask, jsonify, send_from_directory, request
 import threading
 import sqlite3
+import mp4_faststart
+import clip_writer
+import events_db
+import event_archive
+import clip_storage
+import metrics
 
 # -------------------------------
 # DATABASE SETUP
@@ -14,16 +19,11 @@ import sqlite3
 conn = sqlite3.connect("events.db", check_same_thread=False)
 cursor = conn.cursor()
 
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS events (
- id INTEGER PRIMARY KEY AUTOINCREMENT,
- timestamp TEXT,
- status TEXT,
- clip_path TEXT,
- camera_id TEXT
-)
-""")
-conn.commit()
+events_db.init(conn)
+event_archive.init(conn)
+
+archiver = event_archive.Archiver("events.db")
+archiver.start()
 
 # -------------------------------
 # AI MODEL + CAMERA
@@ -37,7 +37,7 @@ if os.environ.get("RENDER") != "true":
 
 FPS = int(cap.get(cv2.CAP_PROP_FPS) or 30)
 BUFFER_SECONDS = 10
-buffer = deque(maxlen=FPS * BUFFER_SECONDS)
+buffer = clip_writer.FrameBuffer(BUFFER_SECONDS, max_frames=FPS * BUFFER_SECONDS * 4)
 
 
 
@@ -57,7 +57,17 @@ last_status = None
 status_color = (0, 255, 0)
 status_display_until = 0
 
-os.makedirs("clips", exist_ok=True)
+# Local clip storage limits
+CLIP_QUOTA_BYTES = int(os.environ.get("CLIP_QUOTA_BYTES", 2 * 1024 ** 3))
+CLIP_MAX_AGE_DAYS = float(os.environ.get("CLIP_MAX_AGE_DAYS", 14))
+
+storage = clip_storage.ClipStorage(
+    "events.db", "clips",
+    max_bytes=CLIP_QUOTA_BYTES,
+    max_age=CLIP_MAX_AGE_DAYS * 86400
+)
+storage.sync_dir()
+storage.enforce()
 
 # -------------------------------
 # FLASK SERVER
@@ -72,22 +82,59 @@ def trigger_scan():
 
 @app.route("/events")
 def get_events():
-    cursor.execute("SELECT * FROM events ORDER BY id DESC")
+    cursor.execute(f"SELECT {', '.join(events_db.EVENT_FIELDS)} FROM events ORDER BY id DESC")
     rows = cursor.fetchall()
 
-    return jsonify([
-        {
-            "id": r[0],
-            "timestamp": r[1],
-            "status": r[2],
-            "clip_path": r[3],
-            "camera_id": r[4]
-        } for r in rows
-    ])
+    return jsonify([dict(zip(events_db.EVENT_FIELDS, r)) for r in rows])
+
+# Clip files are never rewritten once served, so browsers may cache them
+CLIP_MAX_AGE = 7 * 24 * 3600
+faststart_checked = set()
+# A fixed set of locks picked by file name, so requests for names that do
+# not exist cannot grow it
+faststart_locks = [threading.Lock() for _ in range(16)]
 
 @app.route("/clips/<path:filename>")
 def serve_clip(filename):
-    return send_from_directory("clips", filename)
+    # Older clips were written with moov at the end; fix them on first view.
+    # A browser's first requests for a clip arrive together, so the rewrite
+    # is locked per file and the others wait for it instead of racing it
+    path = os.path.join("clips", filename)
+    if filename not in faststart_checked and os.path.isfile(path) \
+            and os.path.realpath(path).startswith(os.path.realpath("clips") + os.sep):
+        with faststart_locks[hash(filename) % len(faststart_locks)]:
+            if filename not in faststart_checked:
+                mp4_faststart.make_faststart(path)
+                faststart_checked.add(filename)
+
+    if filename.endswith(".mp4"):
+        storage.touch(os.path.join("clips", filename))
+
+    # conditional=True gives Range (206), ETag and Last-Modified handling
+    response = send_from_directory(
+        "clips", filename,
+        conditional=True,
+        etag=True,
+        max_age=CLIP_MAX_AGE
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.headers["Accept-Ranges"] = "bytes"
+    return response
+
+@app.route("/rollups")
+def get_rollups():
+    return jsonify(event_archive.rollups(
+        conn,
+        granularity=request.args.get("granularity", "day"),
+        since=request.args.get("since"),
+        until=request.args.get("until"),
+        camera_id=request.args.get("camera_id")
+    ))
+
+@app.route("/metrics")
+def get_metrics():
+    return jsonify(metrics.snapshot())
 
 @app.route("/dashboard")
 def dashboard():
@@ -103,6 +150,7 @@ def dashboard():
     th,td {padding:12px;}
     th {background:#334155;}
     .verified {color:#22c55e; font-weight:bold;}
+    .poster {width:120px; border-radius:4px; display:block;}
     .unauthorized {color:#ef4444; font-weight:bold;}
     a {color:#38bdf8;}
     </style>
@@ -120,7 +168,7 @@ def dashboard():
     <table>
     <thead>
     <tr>
-    <th>ID</th><th>Timestamp</th><th>Status</th><th>Camera</th><th>Clip</th>
+    <th>ID</th><th>Timestamp</th><th>Status</th><th>Camera</th><th>Preview</th><th>Clip</th>
     </tr>
     </thead>
     <tbody id="table"></tbody>
@@ -131,29 +179,35 @@ def dashboard():
         const res = await fetch('/events');
         const data = await res.json();
 
-        let verified=0, unauthorized=0;
         const table=document.getElementById("table");
         table.innerHTML="";
 
         data.forEach(e=>{
-            if(e.status==="UNAUTHORIZED") unauthorized++;
-            else verified++;
-
             const row=document.createElement("tr");
             row.innerHTML=`
             <td>${e.id}</td>
             <td>${e.timestamp}</td>
             <td class="${e.status==="UNAUTHORIZED"?"unauthorized":"verified"}">${e.status}</td>
             <td>${e.camera_id}</td>
+            <td>${e.poster_path?`<a href="/clips/${(e.strip_path||e.poster_path).replace("clips/","")}" target="_blank"><img class="poster" loading="lazy" src="/clips/${e.poster_path.replace("clips/","")}"></a>`:"-"}</td>
             <td>${e.clip_path?`<a href="/clips/${e.clip_path.replace("clips/","")}" target="_blank">View Clip</a>`:"-"}</td>
             `;
             table.appendChild(row);
         });
 
-        document.getElementById("total").innerText=data.length;
+        // Totals come from the daily rollups so archived events still count
+        const rollups = await (await fetch('/rollups')).json();
+        let verified=0, unauthorized=0;
+        rollups.forEach(r=>{
+            if(r.status==="UNAUTHORIZED") unauthorized+=r.count;
+            else verified+=r.count;
+        });
+        const total=verified+unauthorized;
+
+        document.getElementById("total").innerText=total;
         document.getElementById("verified").innerText=verified;
         document.getElementById("unauthorized").innerText=unauthorized;
-        document.getElementById("rate").innerText=data.length?((unauthorized/data.length)*100).toFixed(1)+"%":"0%";
+        document.getElementById("rate").innerText=total?((unauthorized/total)*100).toFixed(1)+"%":"0%";
     }
 
     load();
@@ -185,10 +239,8 @@ while True:
     dx2 = int(w * 0.75)
     dy1 = 0
     dy2 = h
+    raw=frame.copy()
 
-
-    buffer.append(frame.copy())
-    
     # Blue door zone
     cv2.rectangle(frame,(dx1,dy1),(dx2,dy2),(255,0,0),2)
 
@@ -200,6 +252,8 @@ while True:
         ids = results[0].boxes.id.cpu().tolist()
         boxes = results[0].boxes.xyxy.cpu().tolist()
 
+    buffer.append(clip_writer.BufferedFrame(time.time(),raw,ids,boxes))
+
     valid_ids=set()
 
     for box,tid in zip(boxes,ids):
@@ -261,20 +315,31 @@ while True:
                 filename=f"event_{ts}.mp4"
                 path=os.path.join("clips",filename)
 
+                # Real capture rate, so the clip plays back in real time
+                clip_fps=buffer.measured_fps() or FPS
+
                 h,w,_=frame.shape
                 out=cv2.VideoWriter(path,
                     cv2.VideoWriter_fourcc(*"mp4v"),
-                    FPS,(w,h))
+                    clip_fps,(w,h))
 
+                artifacts=clip_writer.ClipArtifacts()
                 for f in buffer:
-                    out.write(f)
+                    out.write(f.frame)
+                    artifacts.add(f)
                 out.release()
 
+                # Poster, thumbnail strip and detection index for the dashboard
+                previews=artifacts.save(path,round(clip_fps,2))
+                storage.register(path,list(previews.values()))
+                storage.enforce()
+
                 cursor.execute("""
-                INSERT INTO events (timestamp,status,clip_path,camera_id)
-                VALUES (?,?,?,?)
+                INSERT INTO events (timestamp,status,clip_path,camera_id,poster_path,strip_path,index_path)
+                VALUES (?,?,?,?,?,?,?)
                 """,(readable_time,"UNAUTHORIZED",
-                     f"clips/{filename}","CAM_01"))
+                     f"clips/{filename}","CAM_01",
+                     previews["poster_path"],previews["strip_path"],previews["index_path"]))
             else:
                 last_status="ACCESS VERIFIED"
                 status_color=(0,200,0)
@@ -0,0 +1,38 @@
+import threading
+import time
+
+# -------------------------------
+# IN-PROCESS METRICS
+# -------------------------------
+#
+# Counters and gauges kept in memory and served as JSON from /metrics.
+# Each process (gunicorn worker, vision loop) reports its own numbers.
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_started = time.time()
+
+
+def inc(name, n=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def set_gauge(name, value):
+    with _lock:
+        _gauges[name] = value
+
+
+def get(name, default=0):
+    with _lock:
+        return _counters.get(name, _gauges.get(name, default))
+
+
+def snapshot():
+    with _lock:
+        return {
+            "uptime_s": round(time.time() - _started, 1),
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+        }
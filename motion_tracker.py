@@ -0,0 +1,125 @@
+import cv2
+import numpy as np
+
+import metrics
+
+# -------------------------------
+# SPARSE DETECTION + BOX PREDICTION
+# -------------------------------
+#
+# With DETECT_MAX_INTERVAL > 1 the detector (model.track) only runs every
+# N frames. N adapts to how much the scene is moving: a still doorway gets
+# the full interval, any real motion drops it back towards every frame, and
+# during a scan window it is capped further. In between, each track's box
+# is carried forward by a constant-velocity Kalman filter, keeping the
+# tracker's IDs, so the tailgating logic still sees boxes on every frame.
+
+
+class KalmanBox:
+    # State: cx, cy, w, h and their per-frame velocities
+    def __init__(self, box):
+        self.x = np.zeros(8)
+        self.x[:4] = _to_cxcywh(box)
+        self.P = np.diag([10.0, 10.0, 10.0, 10.0, 100.0, 100.0, 100.0, 100.0])
+
+    F = np.eye(8)
+    F[:4, 4:] = np.eye(4)
+    H = np.eye(4, 8)
+    Q = np.diag([1.0, 1.0, 1.0, 1.0, 0.5, 0.5, 0.1, 0.1])
+    R = np.diag([4.0, 4.0, 16.0, 16.0])
+
+    def predict(self):
+        self.x = self.F @ self.x
+        self.P = self.F @ self.P @ self.F.T + self.Q
+        # Boxes never shrink to nothing between detections
+        self.x[2:4] = np.maximum(self.x[2:4], 1.0)
+        return self.box()
+
+    def update(self, box):
+        y = _to_cxcywh(box) - self.H @ self.x
+        S = self.H @ self.P @ self.H.T + self.R
+        K = self.P @ self.H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ y
+        self.P = (np.eye(8) - K @ self.H) @ self.P
+
+    def box(self):
+        cx, cy, w, h = self.x[:4]
+        return [cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2]
+
+
+def _to_cxcywh(box):
+    x1, y1, x2, y2 = box
+    return np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1], dtype=float)
+
+
+class BoxPredictor:
+    def __init__(self):
+        self.tracks = {}
+
+    def predict(self):
+        # Advances every track one frame; returns (ids, boxes) like the
+        # detector output.
+        ids = list(self.tracks)
+        return ids, [self.tracks[i].predict() for i in ids]
+
+    def update(self, ids, boxes):
+        # Detector output is authoritative: unseen tracks are dropped (the
+        # detector's own tracker handles occlusion and re-identification).
+        seen = {}
+        for tid, box in zip(ids, boxes):
+            track = self.tracks.get(tid)
+            if track is None:
+                track = KalmanBox(box)
+            else:
+                track.predict()
+                track.update(box)
+            seen[tid] = track
+        self.tracks = seen
+
+
+class DetectionScheduler:
+    def __init__(self, max_interval=1, scan_max_interval=2,
+                 low_motion=0.004, high_motion=0.03):
+        self.max_interval = max(1, max_interval)
+        self.scan_max_interval = max(1, scan_max_interval)
+        self.low_motion = low_motion
+        self.high_motion = high_motion
+        self.prev = None
+        self.since_detect = None
+        self.interval = 1
+        self.motion = 0.0
+
+    def _motion(self, frame):
+        small = cv2.cvtColor(cv2.resize(frame, (64, 36), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        motion = 0.0
+        if self.prev is not None:
+            motion = float(cv2.absdiff(small, self.prev).mean()) / 255.0
+        self.prev = small
+        return motion
+
+    def should_detect(self, frame, scanning=False, min_interval=1):
+        # min_interval comes from load shedding and overrides the motion
+        # and scan caps: an overloaded box skips frames even mid-scan
+        if self.max_interval == 1 and min_interval == 1:
+            return True
+
+        interval = 1
+        if self.max_interval > 1:
+            self.motion = self._motion(frame)
+
+            # Linear from max_interval at low motion down to 1 at high motion
+            span = max(1e-6, self.high_motion - self.low_motion)
+            level = min(1.0, max(0.0, (self.motion - self.low_motion) / span))
+            interval = round(self.max_interval - level * (self.max_interval - 1))
+            if scanning:
+                interval = min(interval, self.scan_max_interval)
+        self.interval = max(1, interval, min_interval)
+
+        if self.since_detect is None or self.since_detect + 1 >= self.interval:
+            self.since_detect = 0
+            metrics.inc("detect.run")
+            return True
+
+        self.since_detect += 1
+        metrics.inc("detect.skipped")
+        return False
@@ -0,0 +1,136 @@
+import os
+import struct
+
+# -------------------------------
+# MP4 FAST-START REWRITE
+# -------------------------------
+#
+# VideoWriter puts the moov atom (the index) after the media data, so a
+# browser has to fetch the end of the file before it can start playing.
+# This moves moov in front of mdat and shifts the chunk offsets in every
+# stco/co64 table accordingly (the same thing qt-faststart does), without
+# needing ffmpeg.
+
+CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+COPY_CHUNK = 1 << 20
+
+
+def _atoms(f, end):
+    # Yields (kind, start, size, header_len) for each atom up to `end`.
+    pos = f.tell()
+    while pos + 8 <= end:
+        f.seek(pos)
+        size, kind = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            raise ValueError(f"corrupt atom {kind!r} at {pos}")
+        yield kind, pos, size, header
+        pos += size
+
+
+def top_level_atoms(path):
+    with open(path, "rb") as f:
+        return list(_atoms(f, os.path.getsize(path)))
+
+
+def is_faststart(path):
+    for kind, _, _, _ in top_level_atoms(path):
+        if kind == b"moov":
+            return True
+        if kind == b"mdat":
+            return False
+    return False
+
+
+def _patch_offsets(moov, delta):
+    # Rewrites stco/co64 entries inside a moov atom held in memory.
+    moov = bytearray(moov)
+
+    def walk(start, end):
+        pos = start
+        while pos + 8 <= end:
+            size, kind = struct.unpack_from(">I4s", moov, pos)
+            header = 8
+            if size == 1:
+                size = struct.unpack_from(">Q", moov, pos + 8)[0]
+                header = 16
+            elif size == 0:
+                size = end - pos
+            if size < header:
+                raise ValueError(f"corrupt atom {kind!r} in moov")
+
+            body = pos + header
+            if kind in CONTAINERS:
+                walk(body, pos + size)
+            elif kind == b"stco":
+                count = struct.unpack_from(">I", moov, body + 4)[0]
+                for i in range(count):
+                    at = body + 8 + i * 4
+                    offset = struct.unpack_from(">I", moov, at)[0] + delta
+                    if offset > 0xFFFFFFFF:
+                        raise OverflowError("stco offset overflow")
+                    struct.pack_into(">I", moov, at, offset)
+            elif kind == b"co64":
+                count = struct.unpack_from(">I", moov, body + 4)[0]
+                for i in range(count):
+                    at = body + 8 + i * 8
+                    struct.pack_into(">Q", moov, at, struct.unpack_from(">Q", moov, at)[0] + delta)
+            pos += size
+
+    walk(0, len(moov))
+    return bytes(moov)
+
+
+def make_faststart(path):
+    # Returns True if the file was rewritten, False if it already was
+    # fast-start or could not be handled. The original is only replaced once
+    # the new file is complete.
+    try:
+        atoms = top_level_atoms(path)
+    except (OSError, ValueError, struct.error):
+        return False
+
+    kinds = [a[0] for a in atoms]
+    if b"moov" not in kinds or b"mdat" not in kinds:
+        return False
+
+    moov_idx = kinds.index(b"moov")
+    mdat_idx = kinds.index(b"mdat")
+    if moov_idx < mdat_idx or b"mdat" in kinds[moov_idx:]:
+        return False
+
+    _, moov_start, moov_size, _ = atoms[moov_idx]
+    tmp = path + ".faststart"
+
+    try:
+        with open(path, "rb") as src:
+            src.seek(moov_start)
+            moov = _patch_offsets(src.read(moov_size), moov_size)
+
+            with open(tmp, "wb") as dst:
+                for i, (kind, start, size, _) in enumerate(atoms):
+                    if i == moov_idx:
+                        continue
+                    if i == mdat_idx:
+                        dst.write(moov)
+                    src.seek(start)
+                    remaining = size
+                    while remaining:
+                        block = src.read(min(COPY_CHUNK, remaining))
+                        if not block:
+                            break
+                        dst.write(block)
+                        remaining -= len(block)
+
+        os.replace(tmp, path)
+        return True
+    except (OSError, ValueError, OverflowError, struct.error) as e:
+        print("Faststart error:", e)
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return False
@@ -0,0 +1,243 @@
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+# -------------------------------
+# ON-DEMAND PROFILING
+# -------------------------------
+#
+# Profiles the running process for a few seconds when asked (see
+# /debug/profile in app.py) and costs nothing otherwise:
+#
+#   sample   - walks every thread's stack ~200 times a second and returns
+#              collapsed stacks (flamegraph.pl / speedscope input)
+#   cprofile - deterministic cProfile of the vision loop (which calls
+#              checkpoint() once per frame) and of request threads started
+#              during the window; returns a pstats file or text. On Python
+#              3.12+ cProfile hooks sys.monitoring, which is process-wide:
+#              one profiler covers every thread and checkpoint() stays idle
+#   memory   - tracemalloc snapshot; top allocation sites as text or the
+#              raw snapshot for tracemalloc.Snapshot.load()
+#
+# One session per mode at a time, so a CPU profile and a memory snapshot
+# can run together.
+
+SAMPLE_INTERVAL = 0.005
+MEMORY_FRAMES = 25
+
+# Only one cProfile.Profile can be enabled at a time, and it sees all threads
+GLOBAL_CPROFILE = sys.version_info >= (3, 12)
+
+_busy = {}
+_busy_lock = threading.Lock()
+
+_cpu_session = None
+_local = threading.local()
+
+
+class Busy(Exception):
+    pass
+
+
+def _claim(mode):
+    with _busy_lock:
+        if _busy.get(mode):
+            raise Busy(f"a {mode} profile is already running")
+        _busy[mode] = True
+
+
+def _release(mode):
+    with _busy_lock:
+        _busy[mode] = False
+
+
+# ---- sampling ----
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample(seconds, interval=SAMPLE_INTERVAL):
+    # Collapsed stacks, one "thread;outer;...;inner count" line per stack
+    _claim("sample")
+    try:
+        me = threading.get_ident()
+        counts = Counter()
+        names = {}
+        deadline = time.perf_counter() + seconds
+
+        while time.perf_counter() < deadline:
+            frames = sys._current_frames()
+            if frames.keys() - names.keys():
+                names = {t.ident: t.name for t in threading.enumerate()}
+
+            for ident, frame in frames.items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                counts[";".join(reversed(stack))] += 1
+
+            del frames, frame
+            time.sleep(interval)
+
+        return "".join(f"{stack} {n}\n" for stack, n in counts.most_common())
+    finally:
+        _release("sample")
+
+
+# ---- cProfile ----
+
+class _CpuSession:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.profiles = []
+
+    def attach(self):
+        # Starts a profiler for the calling thread
+        profile = cProfile.Profile()
+        profile.enable()
+        with self.lock:
+            self.profiles.append(profile)
+        return profile
+
+
+def checkpoint():
+    # Called once per iteration by long-running loops. Attaches the thread
+    # to an active cProfile session and detaches it when the session ends;
+    # two attribute reads when nothing is being profiled.
+    session = _cpu_session
+    current = getattr(_local, "cpu", None)
+    try:
+        if current is None:
+            if session is not None:
+                # Marked first, so a failed attach is not retried every frame
+                _local.cpu = (session, None)
+                _local.cpu = (session, session.attach())
+        elif current[0] is not session:
+            _local.cpu = None
+            if current[1] is not None:
+                current[1].disable()
+    except Exception as e:
+        # Profiling must never stop the loop it is measuring
+        print("Profiler checkpoint failed:", e)
+
+
+def _thread_hook(frame, event, arg):
+    # Installed with threading.setprofile for the window: every thread
+    # started meanwhile (one per request on the threaded dev server)
+    # swaps this hook for its own profiler
+    sys.setprofile(None)
+    session = _cpu_session
+    if session is not None:
+        try:
+            session.attach()
+        except Exception as e:
+            print("Profiler thread hook failed:", e)
+
+
+def cprofile(seconds, fmt="pstats"):
+    global _cpu_session
+
+    _claim("cprofile")
+    try:
+        session = _CpuSession()
+        if GLOBAL_CPROFILE:
+            try:
+                profile = session.attach()
+            except ValueError as e:
+                # Another tool already holds sys.monitoring's profiler slot
+                raise Busy(f"cProfile is unavailable: {e}")
+            try:
+                time.sleep(seconds)
+            finally:
+                profile.disable()
+        else:
+            _cpu_session = session
+            threading.setprofile(_thread_hook)
+            time.sleep(seconds)
+    finally:
+        threading.setprofile(None)
+        _cpu_session = None
+        _release("cprofile")
+
+    if not GLOBAL_CPROFILE:
+        # Give the loop one frame to notice and detach
+        time.sleep(0.2)
+
+    with session.lock:
+        profiles = list(session.profiles)
+
+    stats = None
+    for profile in profiles:
+        try:
+            if stats is None:
+                stats = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+        except TypeError:
+            # pstats refuses a profile that recorded no calls
+            continue
+    if stats is None:
+        return "" if fmt == "text" else b""
+
+    if fmt == "text":
+        out = io.StringIO()
+        stats.stream = out
+        stats.sort_stats("cumulative").print_stats(60)
+        return out.getvalue()
+    # Same bytes as Stats.dump_stats(); load with pstats.Stats(path)
+    return marshal.dumps(stats.stats)
+
+
+# ---- tracemalloc ----
+
+def memory(seconds, fmt="text", top=50):
+    # Allocations made while tracing; memory allocated before the window
+    # started is not attributed
+    _claim("memory")
+    started_here = not tracemalloc.is_tracing()
+    try:
+        if started_here:
+            tracemalloc.start(MEMORY_FRAMES)
+        time.sleep(seconds)
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+        _release("memory")
+
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    ])
+
+    if fmt == "snapshot":
+        fd, path = tempfile.mkstemp(suffix=".tracemalloc")
+        os.close(fd)
+        try:
+            snapshot.dump(path)
+            with open(path, "rb") as f:
+                return f.read()
+        finally:
+            os.remove(path)
+
+    stats = snapshot.statistics("lineno")
+    total = sum(s.size for s in stats)
+    lines = [f"Traced {total / 1024:.1f} KiB in {len(stats)} allocation sites over {seconds}s"]
+    for s in stats[:top]:
+        frame = s.traceback[0]
+        lines.append(f"{s.size / 1024:10.1f} KiB {s.count:8d} blocks  {frame.filename}:{frame.lineno}")
+    return "\n".join(lines) + "\n"
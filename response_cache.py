@@ -0,0 +1,85 @@
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import Response, make_response, request
+
+import metrics
+
+# -------------------------------
+# READ RESPONSE CACHE
+# -------------------------------
+#
+# Read endpoints only change when events change, so their rendered bodies
+# are cached per path + query string and tagged with the events table
+# version (bumped by trigger on every insert/update/delete, so writes from
+# other workers count too). A client that sends back the ETag of a page
+# that has not changed gets a 304 without the query being run.
+
+
+class ResponseCache:
+    def __init__(self, version_fn, name="events", max_entries=512):
+        self.version_fn = version_fn
+        self.name = name
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _key(self):
+        args = sorted(request.args.items(multi=True))
+        return request.path + "?" + "&".join(f"{k}={v}" for k, v in args)
+
+    def _etag(self, key, version):
+        digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+        return f"{version}-{digest}"
+
+    def _record(self, outcome):
+        metrics.inc(f"cache.{self.name}.{outcome}")
+        hits = metrics.get(f"cache.{self.name}.hits") + metrics.get(f"cache.{self.name}.not_modified")
+        total = hits + metrics.get(f"cache.{self.name}.misses")
+        if total:
+            metrics.set_gauge(f"cache.{self.name}.hit_rate", round(hits / total, 4))
+
+    def _respond(self, data, mimetype, etag):
+        resp = Response(data, mimetype=mimetype)
+        resp.set_etag(etag)
+        # Browsers must revalidate, which is a cheap 304 while nothing changed
+        resp.cache_control.no_cache = True
+        return resp
+
+    def cached(self, view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = self._key()
+            version = self.version_fn()
+            etag = self._etag(key, version)
+
+            if etag in request.if_none_match:
+                self._record("not_modified")
+                resp = Response(status=304)
+                resp.set_etag(etag)
+                return resp
+
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None and entry[0] == version:
+                    self.entries.move_to_end(key)
+                    self._record("hits")
+                    return self._respond(entry[1], entry[2], etag)
+
+            self._record("misses")
+            resp = make_response(view(*args, **kwargs))
+            if resp.status_code != 200:
+                return resp
+
+            data = resp.get_data()
+            with self.lock:
+                self.entries[key] = (version, data, resp.mimetype)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+
+            return self._respond(data, resp.mimetype, etag)
+
+        return wrapper
@@ -0,0 +1,117 @@
+import json
+import time
+
+import events_db
+
+# -------------------------------
+# SCAN TRIGGER / STATE CHANNEL
+# -------------------------------
+#
+# /scan used to flip a module global, which only works when the API and the
+# detection loop live in the same process. Under gunicorn every worker has its
+# own copy, so scans are queued in events.db instead and the vision process
+# claims them. The vision process publishes its tracker state back the same
+# way so any worker can answer /status.
+
+SCAN_MAX_AGE = 10.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scan_requests (
+ id INTEGER PRIMARY KEY AUTOINCREMENT,
+ camera_id TEXT,
+ requested_at REAL,
+ claimed_at REAL,
+ state TEXT DEFAULT 'pending'
+);
+CREATE INDEX IF NOT EXISTS idx_scan_requests_pending
+ ON scan_requests (camera_id, state, id);
+CREATE TABLE IF NOT EXISTS tracker_state (
+ camera_id TEXT PRIMARY KEY,
+ state TEXT,
+ updated_at REAL
+);
+"""
+
+
+connect = events_db.connect
+
+
+def init(db):
+    # executescript() would commit outside the migration transaction
+    with events_db.migration(db):
+        for statement in SCHEMA.split(";"):
+            if statement.strip():
+                db.execute(statement)
+
+
+def request_scan(db, camera_id):
+    cur = db.execute(
+        "INSERT INTO scan_requests (camera_id, requested_at) VALUES (?, ?)",
+        (camera_id, time.time())
+    )
+    db.commit()
+    return cur.lastrowid
+
+
+def claim_scan(db, camera_id, max_age=SCAN_MAX_AGE):
+    # Returns (request_id, queue_latency_seconds) or None. Requests older than
+    # max_age are expired so a vision process coming back up does not start
+    # a scan for someone who badged in minutes ago.
+    now = time.time()
+
+    # Polled every frame, so the common "nothing pending" case is read-only.
+    row = db.execute("""
+    SELECT id, requested_at FROM scan_requests
+    WHERE camera_id = ? AND state = 'pending'
+    ORDER BY id LIMIT 1
+    """, (camera_id,)).fetchone()
+
+    if row is None:
+        return None
+
+    req_id, requested_at = row
+
+    if requested_at < now - max_age:
+        db.execute("""
+        UPDATE scan_requests SET state = 'expired'
+        WHERE camera_id = ? AND state = 'pending' AND requested_at < ?
+        """, (camera_id, now - max_age))
+        db.commit()
+        return claim_scan(db, camera_id, max_age)
+
+    # The state guard makes the claim atomic if two loops poll one camera.
+    cur = db.execute("""
+    UPDATE scan_requests SET state = 'claimed', claimed_at = ?
+    WHERE id = ? AND state = 'pending'
+    """, (now, req_id))
+    db.commit()
+
+    if cur.rowcount == 0:
+        return None
+
+    return req_id, now - requested_at
+
+
+def publish_state(db, camera_id, **state):
+    db.execute("""
+    INSERT INTO tracker_state (camera_id, state, updated_at) VALUES (?, ?, ?)
+    ON CONFLICT(camera_id) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at
+    """, (camera_id, json.dumps(state), time.time()))
+    db.commit()
+
+
+def read_state(db):
+    rows = db.execute("SELECT camera_id, state, updated_at FROM tracker_state").fetchall()
+    return {
+        camera_id: dict(json.loads(state), updated_at=updated_at)
+        for camera_id, state, updated_at in rows
+    }
+
+
+def pending_count(db, camera_id=None):
+    if camera_id is None:
+        return db.execute("SELECT COUNT(*) FROM scan_requests WHERE state = 'pending'").fetchone()[0]
+    return db.execute(
+        "SELECT COUNT(*) FROM scan_requests WHERE state = 'pending' AND camera_id = ?",
+        (camera_id,)
+    ).fetchone()[0]
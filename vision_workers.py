@@ -0,0 +1,283 @@
+import os
+import secrets
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+import metrics
+
+# -------------------------------
+# INFERENCE WORKER PROCESSES
+# -------------------------------
+#
+# Runs model.track in a separate process so PyTorch inference no longer
+# competes with capture, buffering and the Flask threads for one GIL.
+# Each camera gets its own worker (the tracker's state is per stream, so
+# one stream cannot be split across processes); several cameras spread
+# over several cores. Frames are written into shared memory slots owned by
+# the capture side, and only the slot name, shape and a sequence number go
+# over the connection. The worker answers with the track ids and boxes.
+#
+# Workers are started with `python -m vision_workers` rather than
+# multiprocessing, which would re-import app.py in the child.
+
+LOCAL_ADDRESS = ("127.0.0.1", 0)
+
+
+class LocalDetector:
+    # In-process detection, as the loop did before
+    def __init__(self, weights="yolov8n.pt", conf=0.5, classes=(0,)):
+        from ultralytics import YOLO
+        self.model = YOLO(weights)
+        self.conf = conf
+        self.classes = list(classes)
+
+    def track(self, frame, imgsz=None):
+        return _track(self.model, frame, self.conf, self.classes, imgsz)
+
+    def close(self):
+        pass
+
+
+def _track(model, frame, conf, classes, imgsz=None):
+    # imgsz=None keeps the model's default inference size
+    extra = {"imgsz": imgsz} if imgsz else {}
+    results = model.track(frame, conf=conf, classes=classes, persist=True, verbose=False, **extra)
+
+    ids = []
+    boxes = []
+
+    if results[0].boxes.id is not None:
+        ids = results[0].boxes.id.cpu().tolist()
+        boxes = results[0].boxes.xyxy.cpu().tolist()
+
+    return ids, boxes
+
+
+class FrameSlots:
+    # A small ring of shared memory buffers, each big enough for one frame.
+    # The capture side owns (and unlinks) them; a slot is reused only after
+    # the worker has answered for the frame in it.
+    def __init__(self, count=2):
+        self.count = count
+        self.slots = []
+        self.size = 0
+        self.next = 0
+
+    def put(self, frame):
+        if frame.nbytes > self.size:
+            # First frame, or the camera switched to a larger resolution
+            self.close()
+            self.size = frame.nbytes
+            self.slots = [shared_memory.SharedMemory(create=True, size=self.size) for _ in range(self.count)]
+
+        slot = self.slots[self.next]
+        self.next = (self.next + 1) % self.count
+        np.ndarray(frame.shape, frame.dtype, buffer=slot.buf)[...] = frame
+        return slot.name
+
+    def close(self):
+        for slot in self.slots:
+            slot.close()
+            slot.unlink()
+        self.slots = []
+        self.size = 0
+
+
+class InferenceWorker:
+    def __init__(self, weights="yolov8n.pt", conf=0.5, classes=(0,), name="camera",
+                 slots=2, start_timeout=120, timeout=10, restart_backoff=1.0, max_backoff=60.0):
+        self.weights = weights
+        self.conf = conf
+        self.classes = list(classes)
+        self.name = name
+        self.start_timeout = start_timeout
+        self.timeout = timeout
+        self.restart_backoff = restart_backoff
+        self.max_backoff = max_backoff
+        self.restart_failures = 0
+        self.retry_at = 0.0
+        self.frames = FrameSlots(slots)
+        self.seq = 0
+        self.proc = None
+        self.conn = None
+        self._start()
+
+    def _start(self):
+        authkey = secrets.token_bytes(16)
+        listener = Listener(LOCAL_ADDRESS, authkey=authkey)
+        host, port = listener.address
+
+        env = dict(os.environ, AXENTRY_WORKER_AUTHKEY=authkey.hex())
+        self.proc = subprocess.Popen(
+            [
+                sys.executable, "-m", "vision_workers",
+                f"{host}:{port}", self.weights, str(self.conf),
+                ",".join(str(c) for c in self.classes),
+            ],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env,
+        )
+
+        # accept() has no timeout and would block forever if the worker died
+        # before connecting, so it runs on a helper thread
+        accepted = []
+
+        def accept():
+            try:
+                accepted.append(listener.accept())
+            except OSError:
+                pass
+
+        waiter = threading.Thread(target=accept, daemon=True)
+        waiter.start()
+        deadline = time.monotonic() + self.start_timeout
+        # Stops waiting early if the worker exits before connecting
+        while waiter.is_alive() and time.monotonic() < deadline and self.proc.poll() is None:
+            waiter.join(0.1)
+        listener.close()
+
+        if not accepted:
+            self.proc.kill()
+            self.proc.wait()
+            raise RuntimeError(f"Inference worker for {self.name} did not connect")
+
+        self.conn = accepted[0]
+        try:
+            ready = self.conn.poll(self.start_timeout) and self.conn.recv() == ("ready",)
+        except EOFError:
+            ready = False
+
+        if not ready:
+            self.conn.close()
+            self.conn = None
+            self.proc.kill()
+            self.proc.wait()
+            raise RuntimeError(f"Inference worker for {self.name} did not start")
+        print(f"Inference worker for {self.name} running (pid {self.proc.pid})")
+
+    def _restart(self):
+        # True once a worker is running again. If it does not come up, frames
+        # get no detections until the next attempt, which waits twice as
+        # long as the last (up to max_backoff)
+        try:
+            self._start()
+        except (RuntimeError, OSError) as e:
+            self.restart_failures += 1
+            delay = min(self.max_backoff, self.restart_backoff * 2 ** (self.restart_failures - 1))
+            self.retry_at = time.monotonic() + delay
+            print(f"Inference worker for {self.name} did not restart ({e}), retrying in {delay:.0f}s")
+            metrics.inc("inference.restart_failures")
+            return False
+        self.restart_failures = 0
+        return True
+
+    def track(self, frame, imgsz=None):
+        # Blocks until the worker answers; the wait releases the GIL, so the
+        # API threads keep running while the frame is being inferred.
+        if self.conn is None:
+            if time.monotonic() < self.retry_at or not self._restart():
+                return [], []
+
+        self.seq += 1
+        started = time.perf_counter()
+
+        try:
+            slot = self.frames.put(frame)
+            self.conn.send(("frame", self.seq, slot, frame.shape, frame.dtype.str, imgsz))
+
+            while True:
+                if not self.conn.poll(self.timeout):
+                    raise TimeoutError(f"no answer in {self.timeout}s")
+                reply = self.conn.recv()
+                if reply[0] == "result" and reply[1] == self.seq:
+                    break
+        except (EOFError, OSError, TimeoutError) as e:
+            # Crashed or hung worker: restart it and report no detections for
+            # this frame rather than stopping the loop
+            print(f"Inference worker for {self.name} failed ({e}), restarting")
+            metrics.inc("inference.restarts")
+            self._stop()
+            self._restart()
+            return [], []
+
+        _, _, ids, boxes, infer_s = reply
+        metrics.inc("inference.frames")
+        metrics.set_gauge("inference.worker_ms", round(infer_s * 1000, 2))
+        metrics.set_gauge("inference.roundtrip_ms", round((time.perf_counter() - started) * 1000, 2))
+        return ids, boxes
+
+    def _stop(self):
+        if self.conn is not None:
+            try:
+                self.conn.send(("stop",))
+            except Exception:
+                pass
+            self.conn.close()
+            self.conn = None
+        if self.proc is not None:
+            try:
+                self.proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
+
+    def close(self):
+        self._stop()
+        self.frames.close()
+
+
+def _attach(name):
+    # The capture side owns the segment; stop this process's resource
+    # tracker from unlinking it when the worker exits.
+    shm = shared_memory.SharedMemory(name=name)
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def serve(address, weights, conf, classes):
+    from ultralytics import YOLO
+
+    host, port = address.rsplit(":", 1)
+    conn = Client((host, int(port)), authkey=bytes.fromhex(os.environ["AXENTRY_WORKER_AUTHKEY"]))
+
+    model = YOLO(weights)
+    attached = {}
+    conn.send(("ready",))
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message[0] == "stop":
+            break
+
+        _, seq, name, shape, dtype, imgsz = message
+        if name not in attached:
+            if len(attached) >= 8:
+                # Slots were reallocated for a new resolution
+                for shm in attached.values():
+                    shm.close()
+                attached = {}
+            attached[name] = _attach(name)
+        frame = np.ndarray(shape, np.dtype(dtype), buffer=attached[name].buf)
+
+        started = time.perf_counter()
+        ids, boxes = _track(model, frame, conf, classes, imgsz)
+        del frame
+        conn.send(("result", seq, ids, boxes, time.perf_counter() - started))
+
+    for shm in attached.values():
+        shm.close()
+    conn.close()
+
+
+if __name__ == "__main__":
+    address, weights, conf, classes = sys.argv[1:5]
+    serve(address, weights, float(conf), [int(c) for c in classes.split(",") if c])